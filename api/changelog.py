@@ -0,0 +1,138 @@
+"""
+Per-table change log backing the /api/changes delta feed.
+
+Every committed sync records what it did to a table: a snapshot boundary for
+a truncate-reload, then one compact entry per inserted or deleted key. When a
+snapshot is recorded, older entries for that table are pruned since consumers
+have to resync from the snapshot anyway, which keeps the log small.
+
+Tables that are only appended to never get a snapshot, so prune_changes
+(the prune_changes command, run from cron) applies a retention policy:
+entries older than SYNC_CHANGE_RETENTION_DAYS and beyond the newest
+SYNC_CHANGE_RETENTION_ENTRIES of a table. The newest pruned entry is turned
+into a snapshot entry in place, so a consumer whose cursor is below it, and
+who therefore missed pruned changes, reads a snapshot and resyncs the whole
+table just as after a reload. Consumers that kept up never see it.
+"""
+import logging
+import zlib
+
+from django.db import connection, transaction
+from django.dispatch import Signal
+
+from .models import SyncChange
+
+logger = logging.getLogger(__name__)
+
+OP_NAMES = dict(SyncChange.OP_CHOICES)
+
+# Sent with table_name once a transaction that recorded changes commits, so
+# in-process caches of synced tables can be dropped without polling
+changes_committed = Signal()
+
+
+def _notify_on_commit(table_name):
+    transaction.on_commit(
+        lambda: changes_committed.send(sender=SyncChange, table_name=table_name))
+
+
+def _lock_table_feed(table_name):
+    """
+    Serialize change-log writers per table until the transaction ends.
+
+    Sequence numbers are handed out at insert time but become visible at
+    commit time; without this lock a consumer could read seq N+1 before N
+    commits and move its cursor past N. Callers record changes at the end of
+    their transaction so the lock is only held up to the commit.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)',
+                           [0x5C, zlib.crc32(table_name.encode()) & 0x7FFFFFFF])
+
+
+def record_snapshot(table_name):
+    """
+    Record a truncate-reload boundary and prune the entries it supersedes
+    """
+    _lock_table_feed(table_name)
+    _notify_on_commit(table_name)
+    change = SyncChange.objects.create(table_name=table_name, op=SyncChange.OP_SNAPSHOT)
+    pruned, _ = SyncChange.objects.filter(table_name=table_name, seq__lt=change.seq).delete()
+    logger.info(f"Recorded snapshot {change.seq} for {table_name} (pruned {pruned} entries)")
+    return change.seq
+
+
+def _record_keys(table_name, op, keys, batch_size=5000):
+    _lock_table_feed(table_name)
+    _notify_on_commit(table_name)
+    changes = [
+        SyncChange(table_name=table_name, op=op, row_key=None if key is None else str(key))
+        for key in keys
+    ]
+    SyncChange.objects.bulk_create(changes, batch_size=batch_size)
+    return len(changes)
+
+
+def record_inserts(table_name, Model, rows):
+    """
+    Record the primary keys of inserted rows (tuples in concrete field order)
+    """
+    pk_index = Model._meta.concrete_fields.index(Model._meta.pk)
+    return _record_keys(table_name, SyncChange.OP_INSERT, (row[pk_index] for row in rows))
+
+
+def record_deletes(table_name, keys):
+    """
+    Record the primary keys of deleted rows
+    """
+    return _record_keys(table_name, SyncChange.OP_DELETE, keys)
+
+
+def latest_seq(table_name, using=None):
+    """
+    Highest sequence number recorded for a table, or 0 if none
+    """
+    last = (SyncChange.objects.using(using).filter(table_name=table_name)
+            .order_by('-seq').values_list('seq', flat=True).first())
+    return last or 0
+
+
+def iter_changes(table_name, since, limit):
+    """
+    Yield (seq, op name, key) for changes after the cursor, oldest first,
+    and at most limit + 1 of them so callers can tell whether more remain.
+    """
+    queryset = (SyncChange.objects
+                .filter(table_name=table_name, seq__gt=since)
+                .order_by('seq')
+                .values_list('seq', 'op', 'row_key'))[:limit + 1]
+    for seq, op, row_key in queryset.iterator(chunk_size=2000):
+        yield seq, OP_NAMES[op], row_key
+
+
+def prune_changes(table_name, before=None, keep=None):
+    """
+    Apply the retention policy to one table: drop the entries created before
+    `before` and those beyond the newest `keep`, leaving a snapshot entry at
+    the newest dropped seq. Returns the number of entries removed.
+    """
+    with transaction.atomic():
+        _lock_table_feed(table_name)
+        entries = SyncChange.objects.filter(table_name=table_name).order_by('-seq')
+        cutoffs = []
+        if before is not None:
+            cutoffs.append(entries.filter(created_at__lt=before).values_list('seq', flat=True).first())
+        if keep:
+            cutoffs.append(entries.values_list('seq', flat=True)[keep:keep + 1].first())
+        cutoff = max((seq for seq in cutoffs if seq is not None), default=None)
+        if cutoff is None:
+            return 0
+
+        pruned, _ = SyncChange.objects.filter(table_name=table_name, seq__lt=cutoff).delete()
+        boundary = SyncChange.objects.filter(table_name=table_name, seq=cutoff)
+        if boundary.exclude(op=SyncChange.OP_SNAPSHOT).update(op=SyncChange.OP_SNAPSHOT, row_key=None):
+            pruned += 1
+    if pruned:
+        logger.info(f"Pruned {pruned} change log entries of {table_name} up to seq {cutoff}")
+    return pruned
@@ -0,0 +1,232 @@
+"""
+Order-independent table digests for /api/tables/<table>/checksum.
+
+Each row is rendered to a canonical text form, hashed with MD5 and the first
+60 bits of every row hash are summed, so the digest does not depend on row
+order and a client can compute the same value over its local data (see
+api.client.compute_digest). On PostgreSQL the digest is computed in SQL;
+other backends stream the rows through the same canonical form in Python.
+
+The response describes each column the way the server stores it (kind,
+decimal places, whether the server strips the text it is sent), so the
+client can bring raw source values into the same form before hashing.
+
+Optionally the table is split into buckets of roughly equal size ordered by
+primary key (byte order for text keys), each with its own digest, so a
+client can re-send only the key ranges that differ.
+"""
+import hashlib
+from datetime import date
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection, connections, models, router
+from django.db.models.functions import Collate
+
+from .changelog import latest_seq
+
+ALGORITHM = 'md5-sum60-v1'
+NULL_TEXT = '\\N'
+SEPARATOR = '\x1f'
+DIGEST_MODULUS = 2 ** 64
+
+
+def column_kind(field):
+    if isinstance(field, models.DecimalField):
+        return 'decimal'
+    if isinstance(field, models.DateField):
+        return 'date'
+    return 'text'
+
+
+def table_columns(Model, stripped_fields=()):
+    """
+    Field names and kinds in the order used to build the canonical row text,
+    with the decimal places of decimal columns and 'strip' for text columns
+    whose values the server strips before storing them
+    """
+    columns = []
+    for field in Model._meta.concrete_fields:
+        column = {'name': field.attname, 'kind': column_kind(field)}
+        if column['kind'] == 'decimal':
+            column['decimal_places'] = field.decimal_places
+        elif column['kind'] == 'text' and field.attname in stripped_fields:
+            column['strip'] = True
+        columns.append(column)
+    return columns
+
+
+def canonical_value(value):
+    if value is None:
+        return NULL_TEXT
+    if isinstance(value, float):
+        value = Decimal(str(value))
+    if isinstance(value, Decimal):
+        return format(value.normalize(), 'f')
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+def row_hash(values):
+    text = SEPARATOR.join(canonical_value(value) for value in values)
+    return int(hashlib.md5(text.encode('utf-8')).hexdigest()[:15], 16)
+
+
+def key_expression(Model):
+    """
+    Primary key expression with a byte-wise ordering, matching Python's str
+    ordering, so bucket boundaries mean the same thing on both sides
+    """
+    pk = Model._meta.pk
+    if connection.vendor == 'postgresql' and isinstance(pk, models.CharField):
+        return Collate(pk.attname, 'C')
+    return models.F(pk.attname)
+
+
+def key_range_queryset(Model, key_from=None, key_to=None):
+    """
+    Rows whose primary key is in [key_from, key_to); either bound may be None
+    """
+    pk = Model._meta.pk
+    queryset = Model.objects.annotate(_sync_key=key_expression(Model))
+    if key_from is not None:
+        queryset = queryset.filter(_sync_key__gte=pk.to_python(key_from))
+    if key_to is not None:
+        queryset = queryset.filter(_sync_key__lt=pk.to_python(key_to))
+    return queryset
+
+
+def in_key_range(Model, key, key_from=None, key_to=None):
+    """
+    Whether a primary key value falls in [key_from, key_to)
+    """
+    pk = Model._meta.pk
+    key = pk.to_python(key)
+    if key is None:
+        return False
+    if key_from is not None and key < pk.to_python(key_from):
+        return False
+    if key_to is not None and key >= pk.to_python(key_to):
+        return False
+    return True
+
+
+def _bucket_sizes(count, buckets):
+    # Same distribution as SQL ntile(): the first count % buckets get one extra
+    base, extra = divmod(count, buckets)
+    return [base + (1 if i < extra else 0) for i in range(buckets)]
+
+
+def _sql_column(field, quote_name):
+    column = quote_name(field.column)
+    if isinstance(field, models.DecimalField):
+        if field.decimal_places:
+            text = f"rtrim(rtrim({column}::text, '0'), '.')"
+        else:
+            text = f'{column}::text'
+    elif isinstance(field, models.DateField):
+        text = f"to_char({column}, 'YYYY-MM-DD')"
+    else:
+        text = f'{column}::text'
+    return f"COALESCE({text}, '{NULL_TEXT}')"
+
+
+def _digest_postgresql(Model, buckets, using):
+    db = connections[using]
+    quote_name = db.ops.quote_name
+    fields = Model._meta.concrete_fields
+    pk = Model._meta.pk
+    row_text = f"concat_ws(chr(31), {', '.join(_sql_column(field, quote_name) for field in fields)})"
+    row_hash_sql = f"('x' || substr(md5({row_text}), 1, 15))::bit(60)::bigint"
+    table = quote_name(Model._meta.db_table)
+
+    with db.cursor() as cursor:
+        if not buckets:
+            cursor.execute(f'SELECT COUNT(*), COALESCE(SUM({row_hash_sql}), 0) FROM {table}')
+            count, total = cursor.fetchone()
+            return int(count), int(total), []
+
+        key = quote_name(pk.column)
+        if isinstance(pk, models.CharField):
+            key = f'{key} COLLATE "C"'
+        cursor.execute(
+            f'SELECT bucket, MIN(k), COUNT(*), SUM(h) FROM ('
+            f'  SELECT {key} AS k, {row_hash_sql} AS h, ntile(%s) OVER (ORDER BY {key}) AS bucket'
+            f'  FROM {table}'
+            f') s GROUP BY bucket ORDER BY bucket',
+            [buckets])
+        rows = [(pk.to_python(first_key), int(count), int(total))
+                for _, first_key, count, total in cursor.fetchall()]
+
+    return sum(r[1] for r in rows), sum(r[2] for r in rows), rows
+
+
+def _digest_python(Model, buckets, using):
+    fields = [field.attname for field in Model._meta.concrete_fields]
+    pk_index = fields.index(Model._meta.pk.attname)
+    queryset = (Model.objects.using(using).annotate(_sync_key=key_expression(Model))
+                .order_by('_sync_key').values_list(*fields))
+
+    if not buckets:
+        count = total = 0
+        for values in queryset.iterator(chunk_size=5000):
+            count += 1
+            total += row_hash(values)
+        return count, total, []
+
+    sizes = iter([size for size in _bucket_sizes(Model.objects.using(using).count(), buckets) if size])
+    rows = []
+    remaining = 0
+    for values in queryset.iterator(chunk_size=5000):
+        if not remaining:
+            remaining = next(sizes)
+            rows.append([values[pk_index], 0, 0])
+        rows[-1][1] += 1
+        rows[-1][2] += row_hash(values)
+        remaining -= 1
+
+    return sum(r[1] for r in rows), sum(r[2] for r in rows), [tuple(r) for r in rows]
+
+
+def table_checksum(table_name, Model, buckets=0, stripped_fields=()):
+    """
+    Digest of a whole table (and of each bucket when buckets > 0), cached per
+    sync generation: the latest change-log seq of the table. Both are read
+    from the database the router picks for the table (a replica inside
+    read-only endpoints), so they describe the same state.
+    Returns (result dict, served from cache).
+    """
+    using = router.db_for_read(Model)
+    generation = latest_seq(table_name, using=using)
+    cache_key = f'sync:checksum:{table_name}:{buckets}:{generation}'
+    result = cache.get(cache_key)
+    if result is not None:
+        return dict(result, columns=table_columns(Model, stripped_fields)), True
+
+    if connections[using].vendor == 'postgresql':
+        count, total, bucket_rows = _digest_postgresql(Model, buckets, using)
+    else:
+        count, total, bucket_rows = _digest_python(Model, buckets, using)
+
+    result = {
+        'algorithm': ALGORITHM,
+        'generation': generation,
+        'key': Model._meta.pk.attname,
+        'record_count': count,
+        'digest': f'{total % DIGEST_MODULUS:016x}',
+    }
+    if buckets:
+        result['buckets'] = [
+            {
+                'bucket': i,
+                'from': None if i == 0 else canonical_value(first_key),
+                'to': canonical_value(bucket_rows[i + 1][0]) if i + 1 < len(bucket_rows) else None,
+                'record_count': bucket_count,
+                'digest': f'{bucket_total % DIGEST_MODULUS:016x}',
+            }
+            for i, (first_key, bucket_count, bucket_total) in enumerate(bucket_rows)
+        ]
+
+    cache.set(cache_key, result, None)
+    return dict(result, columns=table_columns(Model, stripped_fields)), False
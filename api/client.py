@@ -0,0 +1,530 @@
+"""
+Reference client for the OMEGA sync API.
+
+Reads records from a local CSV, NDJSON or SQLite source and pushes them to
+/api/sync using the is_first_batch / is_last_batch protocol:
+
+- the first batch is sent on its own (the server truncates the table on it),
+- the middle batches are uploaded in parallel over keep-alive connections,
+- the last batch is sent once every other batch has been accepted.
+
+Batch size adapts to the records_per_second the server reports, bodies are
+gzip compressed and failed requests are retried with exponential backoff.
+Batches are not idempotent (a repeated append inserts its rows twice), so
+a POST is only retried when the server cannot have applied it: the
+connection failed before the request was sent, or HTTP 429. Any other
+failure of a batch is raised and the table is synced again from its first
+batch, which truncates it.
+
+This module only depends on the standard library so it can be copied to
+branch machines that do not have Django installed.
+"""
+import bisect
+import csv
+import gzip
+import hashlib
+import http.client
+import json
+import logging
+import random
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import date
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from urllib.parse import quote, urlsplit
+
+logger = logging.getLogger(__name__)
+
+SOURCE_FORMATS = ('csv', 'ndjson', 'sqlite')
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# Safe to retry for any method: the request was rejected before processing
+NOT_PROCESSED_STATUS_CODES = {429}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+
+class SyncError(Exception):
+    """
+    Raised when a batch is rejected or cannot be delivered after all retries
+    """
+
+    def __init__(self, message, status_code=None, response=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = response
+
+
+def detect_format(path):
+    """
+    Guess the source format from the file extension
+    """
+    lowered = str(path).lower()
+    if lowered.endswith('.csv'):
+        return 'csv'
+    if lowered.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    if lowered.endswith(('.sqlite', '.sqlite3', '.db')):
+        return 'sqlite'
+    raise ValueError(f'Cannot detect source format for {path}; use one of {SOURCE_FORMATS}')
+
+
+def read_csv(path):
+    """
+    Yield records from a CSV file with a header row. Empty cells become None.
+    """
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            yield {key: (value if value != '' else None) for key, value in row.items()}
+
+
+def read_ndjson(path):
+    """
+    Yield records from a newline-delimited JSON file
+    """
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise ValueError(f'{path}:{line_number}: invalid JSON: {str(e)}')
+
+
+def read_sqlite(path, table, query=None):
+    """
+    Yield records from a table (or custom query) of a SQLite database
+    """
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    try:
+        cursor = conn.execute(query or f'SELECT * FROM "{table}"')
+        while True:
+            rows = cursor.fetchmany(5000)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(row)
+    finally:
+        conn.close()
+
+
+def open_source(path, table, source_format=None, query=None):
+    """
+    Return an iterator of records for any supported source format
+    """
+    source_format = source_format or detect_format(path)
+    if source_format == 'csv':
+        return read_csv(path)
+    if source_format == 'ndjson':
+        return read_ndjson(path)
+    if source_format == 'sqlite':
+        return read_sqlite(path, table, query=query)
+    raise ValueError(f'Unsupported source format: {source_format}')
+
+
+def _stored(value, column):
+    """
+    A source value as the server stores it in a checksum column: text as
+    sent ('' included), stripped where the server strips it, decimals
+    rounded to the column's places. '' in a decimal or date column cannot
+    be stored as such and counts as NULL.
+    """
+    kind = column.get('kind', 'text')
+    if value is None or (value == '' and kind != 'text'):
+        return None
+    if kind == 'decimal':
+        try:
+            value = Decimal(str(value))
+        except InvalidOperation:
+            return str(value)
+        if column.get('decimal_places') is not None:
+            value = value.quantize(Decimal(1).scaleb(-column['decimal_places']), rounding=ROUND_HALF_UP)
+        return value
+    if kind == 'date':
+        return value.isoformat() if isinstance(value, date) else str(value)[:10]
+    value = str(value)
+    return value.strip() if column.get('strip') else value
+
+
+def _canonical(value, column):
+    # Must match api.checksums.canonical_value / its SQL counterpart
+    value = _stored(value, column)
+    if value is None:
+        return '\\N'
+    if isinstance(value, Decimal):
+        return format(value.normalize(), 'f')
+    return value
+
+
+def _key(value, column):
+    value = _stored(value, column)
+    if column.get('kind') == 'decimal':
+        return Decimal(value)
+    return '' if value is None else value
+
+
+def compute_digest(records, checksum):
+    """
+    Compute, over local records, the digest described by a response of
+    /api/tables/<table>/checksum: same columns, same canonical form and,
+    when present, the same primary-key buckets.
+    """
+    columns = [(column['name'], column) for column in checksum['columns']]
+    key_column = dict(columns)[checksum['key']]
+    buckets = checksum.get('buckets') or []
+    bounds = [_key(bucket['from'], key_column) for bucket in buckets[1:]]
+    totals = [[0, 0] for _ in buckets]
+    count = total = 0
+
+    for record in records:
+        text = '\x1f'.join(_canonical(record.get(name), column) for name, column in columns)
+        row_hash = int(hashlib.md5(text.encode('utf-8')).hexdigest()[:15], 16)
+        count += 1
+        total += row_hash
+        if buckets:
+            index = bisect.bisect_right(bounds, _key(record.get(checksum['key']), key_column))
+            totals[index][0] += 1
+            totals[index][1] += row_hash
+
+    result = {'record_count': count, 'digest': f'{total % 2 ** 64:016x}'}
+    if buckets:
+        result['buckets'] = [
+            dict(bucket, record_count=bucket_count, digest=f'{bucket_total % 2 ** 64:016x}')
+            for bucket, (bucket_count, bucket_total) in zip(buckets, totals)
+        ]
+    return result
+
+
+class AdaptiveBatchSizer:
+    """
+    Pick the next batch size so that one batch takes roughly target_seconds of
+    server time, based on the records_per_second reported by the server.
+    """
+
+    def __init__(self, initial=2000, minimum=500, maximum=50000, target_seconds=2.0, smoothing=0.5):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_seconds = target_seconds
+        self.smoothing = smoothing
+        self.rate = None
+        self._size = max(minimum, min(initial, maximum))
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        return self._size
+
+    def observe(self, records_per_second):
+        if not records_per_second or records_per_second <= 0:
+            return
+        with self._lock:
+            if self.rate is None:
+                self.rate = records_per_second
+            else:
+                self.rate = self.smoothing * records_per_second + (1 - self.smoothing) * self.rate
+            wanted = int(self.rate * self.target_seconds)
+            self._size = max(self.minimum, min(wanted, self.maximum))
+
+
+class SyncClient:
+    """
+    Upload records to a sync API server.
+
+    One HTTP keep-alive connection is kept per worker thread. Use it as a
+    context manager (or call close()) to release the connections.
+    """
+
+    def __init__(self, base_url, database='OMEGA', parallel=4, compress=True,
+                 timeout=300, max_retries=5, backoff=1.0, max_backoff=60.0,
+                 batch_sizer=None, headers=None, max_idle=5.0):
+        parts = urlsplit(base_url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError(f'Unsupported URL scheme: {base_url}')
+
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path.rstrip('/')
+        self.database = database
+        self.parallel = max(1, parallel)
+        self.compress = compress
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.batch_sizer = batch_sizer or AdaptiveBatchSizer()
+        self.headers = headers or {}
+        # Reconnect before reusing a keep-alive connection idle this long,
+        # which the server may have closed; a POST that fails on a closed
+        # connection cannot be retried
+        self.max_idle = max_idle
+
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+    # -- HTTP -----------------------------------------------------------
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn_class = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+            conn = conn_class(self.host, self.port, timeout=self.timeout)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _drop_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+            with self._connections_lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+
+    def request(self, method, path, payload=None):
+        """
+        Send one request, retrying transient failures with exponential backoff.
+        Non-idempotent requests are only retried when they were not processed.
+        Returns (decoded JSON body, raw bytes sent).
+        """
+        body = None
+        headers = {'Accept': 'application/json', 'Connection': 'keep-alive'}
+        headers.update(self.headers)
+        if payload is not None:
+            body = json.dumps(payload, default=str, separators=(',', ':')).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+            if self.compress:
+                body = gzip.compress(body, compresslevel=5)
+                headers['Content-Encoding'] = 'gzip'
+
+        url = f'{self.base_path}{path}'
+        idempotent = method in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            sent = False
+            try:
+                conn = self._connection()
+                if conn.sock is not None and time.monotonic() - getattr(self._local, 'used_at', 0) > self.max_idle:
+                    conn.close()
+                if conn.sock is None:
+                    conn.connect()
+                sent = True
+                conn.request(method, url, body=body, headers=headers)
+                response = conn.getresponse()
+                raw = response.read()
+                self._local.used_at = time.monotonic()
+                if response.getheader('Connection', '').lower() == 'close':
+                    self._drop_connection()
+
+                try:
+                    data = json.loads(raw) if raw else {}
+                except ValueError:
+                    data = {'error': raw[:500].decode('utf-8', 'replace')}
+
+                if response.status < 400:
+                    return data, len(body or b'')
+                if response.status not in RETRYABLE_STATUS_CODES or (
+                        not idempotent and response.status not in NOT_PROCESSED_STATUS_CODES):
+                    raise SyncError(
+                        f"{method} {url} failed with HTTP {response.status}: {data.get('error', data)}",
+                        status_code=response.status, response=data)
+                error = SyncError(
+                    f'{method} {url} returned HTTP {response.status}',
+                    status_code=response.status, response=data)
+            except (ConnectionError, socket.timeout, http.client.HTTPException, OSError) as e:
+                self._drop_connection()
+                if sent and not idempotent:
+                    raise SyncError(
+                        f'{method} {url} failed after it was sent and is not retried, '
+                        f'the server may have applied it: {str(e)}')
+                error = SyncError(f'{method} {url} failed: {str(e)}')
+
+            attempt += 1
+            if attempt > self.max_retries:
+                raise error
+            delay = min(self.max_backoff, self.backoff * (2 ** (attempt - 1)))
+            delay += random.uniform(0, delay / 2)
+            logger.warning(f'{error} (attempt {attempt}/{self.max_retries}, retrying in {delay:.1f}s)')
+            time.sleep(delay)
+
+    def status(self):
+        return self.request('GET', '/api/status')[0]
+
+    def health(self):
+        return self.request('GET', '/api/health')[0]
+
+    # -- Sync -----------------------------------------------------------
+
+    def send_batch(self, table, records, is_first_batch, is_last_batch, **options):
+        """
+        Send a single batch to /api/sync and feed the reported rate back into
+        the batch sizer.
+        """
+        payload = {
+            'database': self.database,
+            'table': table,
+            'data': records,
+            'is_first_batch': is_first_batch,
+            'is_last_batch': is_last_batch,
+        }
+        payload.update(options)
+        result, sent_bytes = self.request('POST', '/api/sync', payload)
+        self.batch_sizer.observe(result.get('records_per_second'))
+        return result, sent_bytes
+
+    def _batches(self, records):
+        """
+        Yield (batch, is_last) pairs, cutting each batch at the size the
+        sizer recommends at that moment.
+        """
+        iterator = iter(records)
+        end = object()
+        pending = next(iterator, end)
+        while pending is not end:
+            batch = [pending]
+            size = self.batch_sizer.size
+            for record in iterator:
+                batch.append(record)
+                if len(batch) >= size:
+                    break
+            pending = next(iterator, end)
+            yield batch, pending is end
+
+    def sync_table(self, table, records, **options):
+        """
+        Push every record of one table and return a throughput report
+        """
+        report = {
+            'table': table,
+            'batches': 0,
+            'records_sent': 0,
+            'records_inserted': 0,
+            'bytes_sent': 0,
+            'server_seconds': 0.0,
+            'wal_bytes': 0,
+        }
+        lock = threading.Lock()
+        start_time = time.monotonic()
+
+        def send(batch, is_first, is_last):
+            result, sent_bytes = self.send_batch(table, batch, is_first, is_last, **options)
+            with lock:
+                report['batches'] += 1
+                report['records_sent'] += len(batch)
+                report['records_inserted'] += result.get('records_inserted', 0)
+                report['bytes_sent'] += sent_bytes
+                report['server_seconds'] += result.get('processing_time_seconds', 0) or 0
+                report['wal_bytes'] += result.get('wal_bytes') or 0
+            logger.info(
+                f"{table}: sent {len(batch)} records "
+                f"(first={is_first}, last={is_last}, next batch size {self.batch_sizer.size})")
+            return result
+
+        batches = self._batches(records)
+        first = next(batches, None)
+        if first is None:
+            # Empty source: a single empty first+last batch clears the table
+            send([], True, True)
+        else:
+            batch, is_last = first
+            send(batch, True, is_last)
+
+            if not is_last:
+                last_batch = None
+                with ThreadPoolExecutor(max_workers=self.parallel) as executor:
+                    in_flight = set()
+                    for batch, is_last in batches:
+                        if is_last:
+                            last_batch = batch
+                            break
+                        in_flight.add(executor.submit(send, batch, False, False))
+                        if len(in_flight) >= self.parallel * 2:
+                            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                future.result()
+                    for future in in_flight:
+                        future.result()
+                send(last_batch, False, True)
+
+        elapsed = time.monotonic() - start_time
+        report['elapsed_seconds'] = round(elapsed, 3)
+        report['server_seconds'] = round(report['server_seconds'], 3)
+        report['records_per_second'] = round(report['records_sent'] / elapsed, 2) if elapsed > 0 else 0
+        report['megabytes_per_second'] = round(report['bytes_sent'] / elapsed / 1e6, 3) if elapsed > 0 else 0
+        return report
+
+    def sync_source(self, table, path, source_format=None, query=None, **options):
+        """
+        Convenience wrapper: read a local source and push it to a table
+        """
+        return self.sync_table(table, open_source(path, table, source_format, query), **options)
+
+    def checksum(self, table, buckets=0):
+        return self.request('GET', f'/api/tables/{quote(table)}/checksum?buckets={int(buckets)}')[0]
+
+    def sync_table_if_changed(self, table, records, buckets=0, **options):
+        """
+        Compare the server checksum with one computed locally and upload only
+        when they differ. With buckets > 0 only the mismatched primary-key
+        ranges are re-sent (as key_range syncs) instead of the whole table.
+        """
+        records = list(records)
+        remote = self.checksum(table, buckets)
+        local = compute_digest(records, remote)
+
+        if local['digest'] == remote['digest'] and local['record_count'] == remote['record_count']:
+            logger.info(f'{table}: unchanged ({remote["record_count"]} records), skipping upload')
+            return {'table': table, 'skipped': True, 'batches': 0, 'records_sent': 0}
+
+        if not buckets or not remote.get('buckets'):
+            report = self.sync_table(table, records, **options)
+            report['skipped'] = False
+            return report
+
+        mismatched = [
+            bucket for bucket, local_bucket in zip(remote['buckets'], local['buckets'])
+            if bucket['digest'] != local_bucket['digest'] or bucket['record_count'] != local_bucket['record_count']
+        ]
+
+        key_name = remote['key']
+        key_column = dict((column['name'], column) for column in remote['columns'])[key_name]
+        report = {'table': table, 'skipped': False, 'batches': 0, 'records_sent': 0, 'ranges_sent': []}
+        start_time = time.monotonic()
+        for bucket in mismatched:
+            low = None if bucket['from'] is None else _key(bucket['from'], key_column)
+            high = None if bucket['to'] is None else _key(bucket['to'], key_column)
+            subset = [
+                record for record in records
+                if (low is None or _key(record.get(key_name), key_column) >= low)
+                and (high is None or _key(record.get(key_name), key_column) < high)
+            ]
+            key_range = {'from': bucket['from'], 'to': bucket['to']}
+            range_report = self.sync_table(table, subset, key_range=key_range, **options)
+            report['batches'] += range_report['batches']
+            report['records_sent'] += range_report['records_sent']
+            report['ranges_sent'].append(key_range)
+        elapsed = time.monotonic() - start_time
+        report['elapsed_seconds'] = round(elapsed, 3)
+        report['records_per_second'] = round(report['records_sent'] / elapsed, 2) if elapsed > 0 else 0
+        logger.info(f"{table}: re-sent {len(mismatched)} of {len(remote['buckets'])} key ranges")
+        return report
@@ -0,0 +1,214 @@
+"""
+Date-range syncs of the master/detail transaction tables.
+
+A sync carrying date_range = {"from": "YYYY-MM-DD", "to": "YYYY-MM-DD"}
+(half-open like key_range, either bound optional) replaces one slice of a
+master table instead of its whole history. Masters declare their date
+column ('date_field') and details their master ('master') in TABLE_MAPPING.
+
+- master table: the first batch deletes the masters dated in the range
+  together with their detail rows, every batch also replaces existing
+  masters (and their details) whose keys it re-sends, e.g. documents whose
+  date moved into the range, and every record must be dated in the range.
+- detail table: the first batch deletes the details of the masters dated
+  in the range, and every record must belong to one of them, so a master
+  table is synced before its details.
+
+Detail rows are deleted by their master column, never by their own primary
+key: a detail key such as acc_invdetails.code (the product code) repeats
+across documents, so matching on it would reach documents outside the
+range. For the same reason the keys reported (and recorded in the change
+feed) for a detail table are the master keys of the deleted rows.
+
+Master tables may be range-partitioned on their date column (PostgreSQL
+declarative partitioning, set up on the database side; the primary key
+then includes the date). Partitions that lie wholly inside the range are
+emptied with TRUNCATE instead of row by row.
+"""
+import logging
+import re
+from collections import defaultdict
+from datetime import date, datetime
+
+from django.core.exceptions import ValidationError
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+PARTITION_BOUND = re.compile(r"FROM \('(\d{4}-\d{2}-\d{2})'\) TO \('(\d{4}-\d{2}-\d{2})'\)")
+
+
+def parse_date_range(value):
+    """
+    Return (date_from, date_to) for a date_range object; raises ValueError
+    """
+    if not isinstance(value, dict) or set(value) - {'from', 'to'} or not (value.get('from') or value.get('to')):
+        raise ValueError('date_range must be an object with "from" and/or "to" dates (YYYY-MM-DD)')
+    bounds = []
+    for name in ('from', 'to'):
+        raw = value.get(name)
+        try:
+            bounds.append(datetime.strptime(raw, '%Y-%m-%d').date() if raw else None)
+        except (TypeError, ValueError):
+            raise ValueError(f'date_range.{name} must be a YYYY-MM-DD date')
+    if bounds[0] and bounds[1] and bounds[0] >= bounds[1]:
+        raise ValueError('date_range.from must be before date_range.to')
+    return tuple(bounds)
+
+
+def date_range_tables(table_mapping):
+    return [name for name, info in table_mapping.items() if 'date_field' in info or 'master' in info]
+
+
+def detail_tables(table_mapping, master_table):
+    """
+    (detail table, column referencing the master key) pairs of a master table
+    """
+    return [(name, info['master'][1]) for name, info in table_mapping.items()
+            if info.get('master', (None,))[0] == master_table]
+
+
+def masters_in_range(table_mapping, master_table, date_from, date_to):
+    info = table_mapping[master_table]
+    filters = {}
+    if date_from is not None:
+        filters[f"{info['date_field']}__gte"] = date_from
+    if date_to is not None:
+        filters[f"{info['date_field']}__lt"] = date_to
+    return info['model'].objects.filter(**filters)
+
+
+def _to_python(field, value):
+    try:
+        return field.to_python(value)
+    except ValidationError:
+        return None
+
+
+def records_outside_range(table_mapping, table_name, rows, date_from, date_to):
+    """
+    Indexes of rows (tuples in concrete field order) that a date-range sync
+    of this table may not contain
+    """
+    info = table_mapping[table_name]
+    Model = info['model']
+    if 'date_field' in info:
+        field = Model._meta.get_field(info['date_field'])
+        index = Model._meta.concrete_fields.index(field)
+        outside = []
+        for i, row in enumerate(rows):
+            value = _to_python(field, row[index])
+            if (value is None or (date_from is not None and value < date_from)
+                    or (date_to is not None and value >= date_to)):
+                outside.append(i)
+        return outside
+
+    master_table, column = info['master']
+    master_pk = table_mapping[master_table]['model']._meta.pk
+    keys = set(masters_in_range(table_mapping, master_table, date_from, date_to)
+               .values_list(master_pk.attname, flat=True))
+    index = Model._meta.concrete_fields.index(Model._meta.get_field(column))
+    return [i for i, row in enumerate(rows) if _to_python(master_pk, row[index]) not in keys]
+
+
+def _delete_rows(Model, queryset):
+    """
+    Delete the rows of a queryset and return their primary keys
+    """
+    pk_name = Model._meta.pk.attname
+    keys = list(queryset.values_list(pk_name, flat=True))
+    if keys:
+        Model.objects.filter(pk__in=queryset.values(pk_name)).delete()
+    return keys
+
+
+def _delete_details(Detail, column, master_keys):
+    """
+    Delete the detail rows whose master column is in master_keys (a values
+    queryset) and return the master key of each deleted row
+    """
+    details = Detail.objects.filter(**{f'{column}__in': master_keys})
+    keys = list(details.values_list(column, flat=True))
+    if keys:
+        details._raw_delete(details.db)
+    return keys
+
+
+def _truncate_covered_partitions(Model, date_from, date_to):
+    """
+    TRUNCATE the partitions of a range-partitioned table that lie wholly in
+    [date_from, date_to) and return the keys they held
+    """
+    if connection.vendor != 'postgresql':
+        return []
+    pk_column = connection.ops.quote_name(Model._meta.pk.column)
+    keys = []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.oid::regclass::text, pg_get_expr(c.relpartbound, c.oid) '
+            'FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = %s::regclass',
+            [Model._meta.db_table])
+        for partition, bound in cursor.fetchall():
+            match = PARTITION_BOUND.search(bound or '')
+            if not match:
+                continue
+            low, high = (date.fromisoformat(value) for value in match.groups())
+            if (date_from is None or low >= date_from) and (date_to is None or high <= date_to):
+                cursor.execute(f'SELECT {pk_column} FROM {partition}')
+                partition_keys = [row[0] for row in cursor.fetchall()]
+                cursor.execute(f'TRUNCATE TABLE {partition}')
+                keys.extend(partition_keys)
+                logger.info(f"Truncated partition {partition} ({len(partition_keys)} records)")
+    return keys
+
+
+def _delete_masters(table_mapping, master_table, masters, partition_range=None):
+    """
+    Delete the masters of a queryset and their detail rows
+    """
+    Model = table_mapping[master_table]['model']
+    pk_name = Model._meta.pk.attname
+    deleted = defaultdict(list)
+    for detail_table, column in detail_tables(table_mapping, master_table):
+        deleted[detail_table] = _delete_details(
+            table_mapping[detail_table]['model'], column, masters.values(pk_name))
+    if partition_range is not None:
+        deleted[master_table] = _truncate_covered_partitions(Model, *partition_range)
+    deleted[master_table] += _delete_rows(Model, masters)
+    return deleted
+
+
+def replace_date_range(table_mapping, table_name, rows, date_from, date_to, is_first_batch, chunk_size=1000):
+    """
+    Delete what one date-range batch replaces, before its rows (tuples in
+    concrete field order) are inserted. Returns {table name: deleted keys},
+    with the master key of each deleted row for detail tables.
+    """
+    info = table_mapping[table_name]
+    Model = info['model']
+    deleted = defaultdict(list)
+
+    def merge(result):
+        for name, keys in result.items():
+            deleted[name].extend(keys)
+
+    if 'date_field' in info:
+        if is_first_batch:
+            merge(_delete_masters(
+                table_mapping, table_name, masters_in_range(table_mapping, table_name, date_from, date_to),
+                partition_range=(date_from, date_to)))
+        pk_index = Model._meta.concrete_fields.index(Model._meta.pk)
+        keys = [row[pk_index] for row in rows if row[pk_index] is not None]
+        for i in range(0, len(keys), chunk_size):
+            merge(_delete_masters(table_mapping, table_name, Model.objects.filter(pk__in=keys[i:i + chunk_size])))
+    elif is_first_batch:
+        master_table, column = info['master']
+        master_pk = table_mapping[master_table]['model']._meta.pk.attname
+        masters = masters_in_range(table_mapping, master_table, date_from, date_to)
+        deleted[table_name] = _delete_details(Model, column, masters.values(master_pk))
+
+    logger.info(
+        f"Date range [{date_from}, {date_to}) of {table_name}: deleted "
+        + (', '.join(f'{len(keys)} from {name}' for name, keys in deleted.items()) or 'nothing'))
+    return {name: keys for name, keys in deleted.items() if keys}
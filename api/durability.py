@@ -0,0 +1,142 @@
+"""
+Durability tiers for sync loads (PostgreSQL only; other backends use 'full').
+
+- full:     the default, every commit is WAL-logged and flushed.
+- relaxed:  SET LOCAL synchronous_commit = off for the load transaction; a
+            crash can lose the last few hundred milliseconds of commits
+            but never corrupts data.
+- unlogged: the table is switched to UNLOGGED right after the first batch
+            truncates it (cheap, the table is empty), batches load without
+            WAL and the table is made LOGGED again on is_last_batch, which
+            writes it to WAL once. Commits are relaxed as well. The table
+            itself is the staging area, so indexes, grants and dependent
+            views stay intact; if the server crashes mid-load the table
+            comes back empty and has to be re-synced.
+
+The level comes from the request ('durability'), then SYNC_TABLE_DURABILITY
+for the table, then SYNC_DEFAULT_DURABILITY.
+
+Standbys cannot read unlogged tables, so switching a table's persistence
+leaves a marker in the cache (UNLOGGED_TABLE_KEY) once it commits and the
+replica router keeps the table's reads on the primary until it is logged
+again and replicas had time to replay that.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+UNLOGGED_TABLE_KEY = 'sync:unlogged:{}'
+
+FULL = 'full'
+RELAXED = 'relaxed'
+UNLOGGED = 'unlogged'
+DURABILITY_LEVELS = (FULL, RELAXED, UNLOGGED)
+
+
+def resolve_durability(table_name, requested=None):
+    if requested:
+        level = requested
+    else:
+        level = getattr(settings, 'SYNC_TABLE_DURABILITY', {}).get(
+            table_name, getattr(settings, 'SYNC_DEFAULT_DURABILITY', FULL))
+    if level not in DURABILITY_LEVELS:
+        raise ValueError(f'Unknown durability {level!r}; use one of {DURABILITY_LEVELS}')
+    if connection.vendor != 'postgresql':
+        return FULL
+    return level
+
+
+def relax_commit():
+    """
+    Do not wait for the WAL flush when the current transaction commits
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SET LOCAL synchronous_commit = off')
+
+
+def is_unlogged(Model):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT relpersistence FROM pg_class WHERE oid = %s::regclass',
+                       [Model._meta.db_table])
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'u'
+
+
+def _mark_unlogged(table_name, logged):
+    key = UNLOGGED_TABLE_KEY.format(table_name)
+    if logged:
+        # Lagging replicas may still replay the table as unlogged for a while
+        # (as long as routers.replay_window())
+        cache.set(key, True, getattr(settings, 'SYNC_REPLICA_MAX_LAG_SECONDS', 10.0)
+                  + getattr(settings, 'SYNC_REPLICA_CHECK_SECONDS', 5.0))
+    else:
+        cache.set(key, True, None)
+
+
+def set_persistence(Model, logged):
+    table_name = connection.ops.quote_name(Model._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {table_name} SET {'LOGGED' if logged else 'UNLOGGED'}")
+    transaction.on_commit(lambda: _mark_unlogged(Model._meta.db_table, logged))
+    logger.info(f"Table {Model._meta.db_table} set {'LOGGED' if logged else 'UNLOGGED'}")
+
+
+def prepare_truncated_table(Model, durability):
+    """
+    Called after the first batch truncated the table: switch it to UNLOGGED
+    for an unlogged load, or back to LOGGED if an earlier unlogged load never
+    finished
+    """
+    if connection.vendor != 'postgresql':
+        return
+    unlogged = is_unlogged(Model)
+    if durability == UNLOGGED and not unlogged:
+        set_persistence(Model, logged=False)
+    elif durability != UNLOGGED and unlogged:
+        set_persistence(Model, logged=True)
+
+
+def finish_unlogged_load(Model):
+    """
+    Called on every is_last_batch: make the table crash-safe again if it is
+    unlogged, whichever durability the batch itself resolved to
+    """
+    if connection.vendor != 'postgresql':
+        return
+    if is_unlogged(Model):
+        set_persistence(Model, logged=True)
+
+
+def wal_position():
+    """
+    Current WAL insert position, or None when it cannot be read
+    """
+    if connection.vendor != 'postgresql':
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_current_wal_insert_lsn()')
+            return cursor.fetchone()[0]
+    except Exception as e:
+        logger.warning(f"Cannot read WAL position: {str(e)}")
+        return None
+
+
+def wal_bytes_since(start):
+    """
+    WAL bytes generated since start. This is cluster-wide, so concurrent
+    activity from other sessions is included.
+    """
+    if start is None:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_wal_lsn_diff(pg_current_wal_insert_lsn(), %s)', [start])
+            return int(cursor.fetchone()[0])
+    except Exception as e:
+        logger.warning(f"Cannot read WAL position: {str(e)}")
+        return None
@@ -0,0 +1,240 @@
+"""
+Concurrent load-test harness for the sync API.
+
+Simulated branch clients replay multi-batch sync sessions for every
+TABLE_MAPPING table (first batch truncates, later batches append), while
+pollers hit /api/status and /api/health. Every request is timed and the run
+ends with per-endpoint p50/p95/p99 latency, throughput and error rates.
+
+Data and schedules come from a seeded random generator, and batch sizes
+are fixed (not adaptive), so two runs with the same options send the same
+requests and can be compared across configurations.
+"""
+import math
+import platform
+import random
+import string
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import connection, models
+
+from .client import AdaptiveBatchSizer, SyncClient, SyncError
+
+
+class RecordGenerator:
+    """
+    Produce realistic-looking rows for a model from its field definitions
+    """
+
+    def __init__(self, Model, rng, key_offset=0):
+        self.Model = Model
+        self.rng = rng
+        self.key_offset = key_offset
+        self.fields = Model._meta.concrete_fields
+        self.words = [''.join(rng.choices(string.ascii_uppercase, k=rng.randint(3, 8))) for _ in range(200)]
+        self.start_date = date(2022, 1, 1)
+
+    def value(self, field, index):
+        rng = self.rng
+        if field.primary_key:
+            key = self.key_offset + index
+            if isinstance(field, models.DecimalField):
+                return key + 1
+            return f'K{key:0{min(field.max_length - 1, 9)}d}'
+        if field.null and rng.random() < 0.1:
+            return None
+        if isinstance(field, models.DecimalField):
+            whole_digits = field.max_digits - field.decimal_places
+            whole = rng.randint(0, 10 ** min(whole_digits, 6) - 1)
+            if not field.decimal_places:
+                return whole
+            fraction = rng.randint(0, 10 ** min(field.decimal_places, 3) - 1)
+            return str(Decimal(f'{whole}.{fraction:0{min(field.decimal_places, 3)}d}'))
+        if isinstance(field, models.DateField):
+            return (self.start_date + timedelta(days=rng.randint(0, 3 * 365))).isoformat()
+        text = ' '.join(rng.choices(self.words, k=rng.randint(1, 4)))
+        return text[:field.max_length]
+
+    def records(self, count):
+        return [
+            {field.attname: self.value(field, index) for field in self.fields}
+            for index in range(count)
+        ]
+
+
+class LatencyRecorder:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_messages = defaultdict(int)
+
+    def record(self, endpoint, seconds, error=None):
+        with self._lock:
+            self.samples[endpoint].append(seconds)
+            if error is not None:
+                self.errors[endpoint] += 1
+                self.error_messages[f'{endpoint}: {error}'[:200]] += 1
+
+
+class TimedSyncClient(SyncClient):
+    """
+    SyncClient that reports the latency of every request it makes
+    """
+
+    def __init__(self, base_url, recorder, **kwargs):
+        super().__init__(base_url, **kwargs)
+        self.recorder = recorder
+
+    def request(self, method, path, payload=None):
+        endpoint = f"{method} {path.split('?')[0]}"
+        start = time.perf_counter()
+        try:
+            result = super().request(method, path, payload)
+        except SyncError as e:
+            detail = (e.response or {}).get('error', '') if isinstance(e.response, dict) else ''
+            self.recorder.record(endpoint, time.perf_counter() - start,
+                                 error=f"{e.status_code or 'connection error'} {detail[:80]}".strip())
+            raise
+        self.recorder.record(endpoint, time.perf_counter() - start)
+        return result
+
+
+def percentile(sorted_values, fraction):
+    """
+    Nearest-rank percentile of an already sorted list
+    """
+    if not sorted_values:
+        return None
+    # The product is rounded first so float noise (0.07 * 100 = 7.000000000000001)
+    # does not move the rank up
+    rank = max(1, math.ceil(round(fraction * len(sorted_values), 9)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class LoadTest:
+
+    def __init__(self, base_url, table_mapping, clients=8, sessions=3, rows=5000, batch_size=1000,
+                 pollers=2, poll_interval=0.5, seed=1, tables=None, compress=True):
+        self.base_url = base_url
+        self.table_mapping = table_mapping
+        self.clients = clients
+        self.sessions = sessions
+        self.rows = rows
+        self.batch_size = batch_size
+        self.pollers = pollers
+        self.poll_interval = poll_interval
+        self.seed = seed
+        self.tables = tables or list(table_mapping)
+        self.compress = compress
+        self.recorder = LatencyRecorder()
+        self.rows_synced = 0
+        self.sessions_failed = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _client(self):
+        return TimedSyncClient(
+            self.base_url, self.recorder, parallel=1, compress=self.compress, max_retries=0,
+            batch_sizer=AdaptiveBatchSizer(initial=self.batch_size, minimum=self.batch_size,
+                                           maximum=self.batch_size))
+
+    def _run_client(self, client_id):
+        rng = random.Random(self.seed * 1000 + client_id)
+        with self._client() as client:
+            for session in range(self.sessions):
+                # Each simulated branch walks the tables in its own fixed order
+                tables = list(self.tables)
+                rng.shuffle(tables)
+                for table in tables:
+                    # Disjoint keys per client, so only real races show up as errors
+                    generator = RecordGenerator(self.table_mapping[table]['model'], rng,
+                                                key_offset=client_id * self.rows)
+                    records = generator.records(self.rows)
+                    try:
+                        report = client.sync_table(table, records)
+                        with self._lock:
+                            self.rows_synced += report['records_sent']
+                    except SyncError:
+                        with self._lock:
+                            self.sessions_failed += 1
+
+    def _run_poller(self, poller_id):
+        with self._client() as client:
+            calls = (client.status, client.health)
+            count = 0
+            while not self._stop.is_set():
+                try:
+                    calls[count % 2]()
+                except SyncError:
+                    pass
+                count += 1
+                self._stop.wait(self.poll_interval)
+
+    def run(self):
+        threads = [threading.Thread(target=self._run_client, args=(i,), daemon=True) for i in range(self.clients)]
+        pollers = [threading.Thread(target=self._run_poller, args=(i,), daemon=True) for i in range(self.pollers)]
+
+        start = time.perf_counter()
+        for thread in pollers + threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self._stop.set()
+        for thread in pollers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        return self.report(elapsed)
+
+    def report(self, elapsed):
+        endpoints = {}
+        for endpoint, samples in sorted(self.recorder.samples.items()):
+            values = sorted(samples)
+            errors = self.recorder.errors[endpoint]
+            endpoints[endpoint] = {
+                'requests': len(values),
+                'errors': errors,
+                'error_rate': round(errors / len(values), 4) if values else 0,
+                'requests_per_second': round(len(values) / elapsed, 2) if elapsed > 0 else 0,
+                'p50_ms': round(percentile(values, 0.50) * 1000, 2),
+                'p95_ms': round(percentile(values, 0.95) * 1000, 2),
+                'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+                'max_ms': round(values[-1] * 1000, 2),
+                'mean_ms': round(sum(values) / len(values) * 1000, 2),
+            }
+
+        total_requests = sum(e['requests'] for e in endpoints.values())
+        total_errors = sum(e['errors'] for e in endpoints.values())
+        return {
+            'config': {
+                'clients': self.clients,
+                'sessions_per_client': self.sessions,
+                'rows_per_table': self.rows,
+                'batch_size': self.batch_size,
+                'pollers': self.pollers,
+                'poll_interval_seconds': self.poll_interval,
+                'tables': self.tables,
+                'seed': self.seed,
+                'compress': self.compress,
+            },
+            'environment': {
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+            },
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_synced': self.rows_synced,
+            'rows_per_second': round(self.rows_synced / elapsed, 2) if elapsed > 0 else 0,
+            'requests': total_requests,
+            'errors': total_errors,
+            'error_rate': round(total_errors / total_requests, 4) if total_requests else 0,
+            'sessions_failed': self.sessions_failed,
+            'endpoints': endpoints,
+            'top_errors': dict(sorted(self.recorder.error_messages.items(), key=lambda item: -item[1])[:10]),
+        }
@@ -0,0 +1,175 @@
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.changelog import record_inserts, record_snapshot
+from api.client import open_source, SOURCE_FORMATS
+from api.validation_pool import collect_validation, create_pool, submit_validation
+from api.views import TABLE_MAPPING, bulk_insert_fastest, truncate_table_fast
+
+
+def _read_chunks(sources, source_format, table_name, chunk_size):
+    """
+    Yield (source, chunk number within the source, offset, records)
+    """
+    offset = 0
+    for source in sources:
+        chunk = []
+        number = 0
+        for record in open_source(source, table_name, source_format):
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                yield source, number, offset, chunk
+                offset += len(chunk)
+                number += 1
+                chunk = []
+        if chunk:
+            yield source, number, offset, chunk
+            offset += len(chunk)
+
+
+class Command(BaseCommand):
+    help = (
+        'Load local CSV/NDJSON files straight into a synced table, bypassing HTTP. '
+        'Records go through the same validation as /api/sync, in parallel chunks, '
+        'and progress is checkpointed so an interrupted load can be resumed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('table', help=f'Target table, one of: {", ".join(TABLE_MAPPING)}')
+        parser.add_argument('sources', nargs='+', help='CSV or NDJSON files to load, in order')
+        parser.add_argument('--format', choices=[f for f in SOURCE_FORMATS if f != 'sqlite'],
+                            help='Source format (default: from extension)')
+        parser.add_argument('--chunk-size', type=int, default=50000, help='Records per chunk / transaction')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Validation worker processes')
+        parser.add_argument('--checkpoint', help='Checkpoint file (default: <first source>.<table>.checkpoint.json)')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint')
+        parser.add_argument('--append', action='store_true', help='Do not truncate the table before loading')
+        parser.add_argument('--skip-invalid', action='store_true',
+                            help='Load valid records and report invalid ones instead of aborting')
+
+    def handle(self, *args, **options):
+        table_name = options['table'].lower()
+        if table_name not in TABLE_MAPPING:
+            raise CommandError(f'Table {table_name} is not supported. Supported tables: {list(TABLE_MAPPING.keys())}')
+
+        Model = TABLE_MAPPING[table_name]['model']
+        sources = [os.path.abspath(path) for path in options['sources']]
+        for path in sources:
+            if not os.path.exists(path):
+                raise CommandError(f'Source not found: {path}')
+
+        checkpoint_path = options['checkpoint'] or f'{sources[0]}.{table_name}.checkpoint.json'
+        checkpoint = self._load_checkpoint(
+            checkpoint_path, table_name, sources, options['chunk_size'], options['restart'])
+        resumed = bool(checkpoint['completed'])
+        if resumed:
+            self.stdout.write(
+                f"Resuming from {checkpoint_path}: {checkpoint['records_loaded']} records already loaded")
+
+        if not checkpoint['truncated'] and not options['append']:
+            with transaction.atomic():
+                deleted_count = truncate_table_fast(Model)
+                record_snapshot(table_name)
+            checkpoint['truncated'] = True
+            self._save_checkpoint(checkpoint_path, checkpoint)
+            self.stdout.write(f'Truncated {table_name} (deleted: {deleted_count})')
+
+        start_time = time.monotonic()
+        loaded = 0
+        invalid = 0
+        method = None
+        chunks = _read_chunks(sources, options['format'], table_name, options['chunk_size'])
+        workers = max(1, options['workers'])
+
+        # Validation runs in worker processes, inserts stay in this process and
+        # are committed chunk by chunk in source order so the checkpoint is exact.
+        with create_pool(workers) as executor:
+            pending = []
+            exhausted = False
+            while pending or not exhausted:
+                while not exhausted and len(pending) < workers * 2:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        exhausted = True
+                        break
+                    source, number, offset, records = chunk
+                    if number < checkpoint['completed'].get(source, 0):
+                        continue
+                    future = submit_validation(executor, records, table_name, offset=offset)
+                    pending.append((source, number, offset, len(records), future))
+
+                if not pending:
+                    break
+
+                source, number, offset, count, future = pending.pop(0)
+                validated_data, errors = collect_validation(future)
+
+                if errors:
+                    invalid += len(errors)
+                    for error in errors[:5]:
+                        self.stderr.write(f"  record {error['record_index']}: {error['error']}")
+                    if not options['skip_invalid']:
+                        raise CommandError(
+                            f'Validation failed for {len(errors)} records in chunk {number} of {source}; '
+                            f'fix the data or use --skip-invalid. Resume with the same command.')
+
+                with transaction.atomic():
+                    inserted_count, method = bulk_insert_fastest(Model, validated_data)
+                    if validated_data:
+                        record_inserts(table_name, Model, validated_data)
+
+                loaded += inserted_count
+                checkpoint['completed'][source] = number + 1
+                checkpoint['records_loaded'] += inserted_count
+                self._save_checkpoint(checkpoint_path, checkpoint)
+
+                elapsed = time.monotonic() - start_time
+                self.stdout.write(
+                    f'{os.path.basename(source)} chunk {number}: +{inserted_count} records '
+                    f"(total {checkpoint['records_loaded']}, {loaded / elapsed:,.0f} records/s)")
+
+        elapsed = time.monotonic() - start_time
+        # An --append load of empty sources never wrote one
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {loaded} records into {table_name} in {elapsed:.2f}s "
+            f"({loaded / elapsed if elapsed > 0 else 0:,.0f} records/s, method: {method or 'none'}, "
+            f"invalid skipped: {invalid}, total loaded incl. resumed: {checkpoint['records_loaded']})"))
+
+    @staticmethod
+    def _load_checkpoint(path, table_name, sources, chunk_size, restart):
+        fresh = {
+            'table': table_name,
+            'sources': sources,
+            'chunk_size': chunk_size,
+            'truncated': False,
+            'completed': {},
+            'records_loaded': 0,
+        }
+        if restart or not os.path.exists(path):
+            return fresh
+
+        with open(path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('table') != table_name or checkpoint.get('sources') != sources:
+            raise CommandError(
+                f'Checkpoint {path} belongs to a different load; use --restart or --checkpoint')
+        # Progress is counted in chunks, so it only holds for the same chunk size
+        if checkpoint.get('chunk_size') != chunk_size:
+            raise CommandError(
+                f"Checkpoint {path} was written with --chunk-size {checkpoint.get('chunk_size')}; "
+                f'resume with that chunk size or use --restart')
+        return checkpoint
+
+    @staticmethod
+    def _save_checkpoint(path, checkpoint):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, path)
@@ -0,0 +1,164 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.loadtest import LoadTest
+from api.views import TABLE_MAPPING
+
+LOADTEST_SETTINGS_MODULE = 'omegaapi.settings_loadtest'
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay concurrent multi-batch sync sessions against a local server and report '
+        'p50/p95/p99 latency, throughput and error rates. Run it with '
+        '--settings=omegaapi.settings_loadtest to use a local SQLite or PostgreSQL database. '
+        'The sync sessions truncate and reload the synced tables.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Test an already running server instead of starting one')
+        parser.add_argument('--server', choices=['runserver', 'gunicorn'], default='runserver',
+                            help='How to start the app when --url is not given')
+        parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--no-setup', action='store_true',
+                            help='Do not migrate or create the synced tables before the run')
+        parser.add_argument('--clients', type=int, default=8, help='Simulated branch clients')
+        parser.add_argument('--sessions', type=int, default=3, help='Sync sessions per client')
+        parser.add_argument('--rows', type=int, default=5000, help='Rows per table per session')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--tables', nargs='+', choices=list(TABLE_MAPPING), help='Tables to sync (default: all)')
+        parser.add_argument('--pollers', type=int, default=2, help='Threads polling /api/status and /api/health')
+        parser.add_argument('--poll-interval', type=float, default=0.5)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--no-compress', action='store_true')
+        parser.add_argument('--report', help='Write the JSON report to this file')
+        parser.add_argument('--allow-any-settings', action='store_true',
+                            help=f'Run with settings other than {LOADTEST_SETTINGS_MODULE}; the synced '
+                                 'tables of that database (or of the --url server) are truncated')
+
+    def handle(self, *args, **options):
+        if settings.SETTINGS_MODULE != LOADTEST_SETTINGS_MODULE and not options['allow_any_settings']:
+            raise CommandError(
+                f'loadtest migrates the database and truncates every synced table, so it only runs with '
+                f'--settings={LOADTEST_SETTINGS_MODULE} (current: {settings.SETTINGS_MODULE}). '
+                f'Pass --allow-any-settings to run it against this database anyway.')
+        if not options['no_setup']:
+            self._setup_schema()
+
+        server = None
+        base_url = options['url']
+        if not base_url:
+            base_url = f"http://127.0.0.1:{options['port']}"
+            server = self._start_server(options)
+
+        try:
+            self._wait_healthy(base_url, server)
+            self.stdout.write(
+                f"Running {options['clients']} clients x {options['sessions']} sessions "
+                f"x {len(options['tables'] or TABLE_MAPPING)} tables against {base_url} ...")
+            report = LoadTest(
+                base_url, TABLE_MAPPING,
+                clients=options['clients'],
+                sessions=options['sessions'],
+                rows=options['rows'],
+                batch_size=options['batch_size'],
+                pollers=options['pollers'],
+                poll_interval=options['poll_interval'],
+                seed=options['seed'],
+                tables=options['tables'],
+                compress=not options['no_compress'],
+            ).run()
+        finally:
+            if server is not None:
+                server.terminate()
+                try:
+                    server.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    server.kill()
+
+        if server is not None:
+            report['config']['server'] = options['server']
+            report['config']['server_workers'] = options['workers'] if options['server'] == 'gunicorn' else 1
+
+        self._print_report(report)
+        if options['report']:
+            with open(options['report'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['report']}")
+
+    def _setup_schema(self):
+        """
+        Create sync_changes (migrations) and the unmanaged synced tables
+        """
+        call_command('migrate', verbosity=0)
+        existing = set(connection.introspection.table_names())
+        with connection.schema_editor() as editor:
+            for Model in apps.get_app_config('api').get_models():
+                if not Model._meta.managed and Model._meta.db_table not in existing:
+                    editor.create_model(Model)
+                    self.stdout.write(f'Created table {Model._meta.db_table}')
+
+    def _start_server(self, options):
+        # The server must use the same settings (and database) as this command
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        address = f"127.0.0.1:{options['port']}"
+
+        if options['server'] == 'gunicorn':
+            gunicorn = shutil.which('gunicorn')
+            if not gunicorn:
+                raise CommandError('gunicorn is not installed')
+            command = [gunicorn, 'omegaapi.wsgi', '--workers', str(options['workers']),
+                       '--bind', address, '--log-level', 'warning']
+        else:
+            command = [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'runserver', address, '--noreload']
+
+        self.stdout.write(f"Starting server: {' '.join(command)}")
+        # runserver logs every request; a file keeps a full pipe from stalling it
+        self._server_log = tempfile.TemporaryFile()
+        return subprocess.Popen(command, cwd=str(settings.BASE_DIR), env=env,
+                                stdout=subprocess.DEVNULL, stderr=self._server_log)
+
+    def _wait_healthy(self, base_url, server, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server is not None and server.poll() is not None:
+                self._server_log.seek(0)
+                output = self._server_log.read()[-4000:].decode(errors='replace')
+                raise CommandError(f'Server exited early:\n{output}')
+            try:
+                with urllib.request.urlopen(f'{base_url}/api/health', timeout=2) as response:
+                    if response.status == 200:
+                        return
+            except OSError:
+                pass
+            time.sleep(0.3)
+        raise CommandError(f'Server at {base_url} did not become healthy within {timeout}s')
+
+    def _print_report(self, report):
+        self.stdout.write('')
+        self.stdout.write(f"{'endpoint':<28}{'requests':>10}{'errors':>8}{'req/s':>10}"
+                          f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for endpoint, stats in report['endpoints'].items():
+            self.stdout.write(
+                f"{endpoint:<28}{stats['requests']:>10}{stats['errors']:>8}{stats['requests_per_second']:>10}"
+                f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['max_ms']:>10}")
+        self.stdout.write('')
+        for message, count in report['top_errors'].items():
+            self.stderr.write(f'  {count} x {message}')
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['rows_synced']} rows in {report['elapsed_seconds']}s "
+            f"({report['rows_per_second']} rows/s), {report['requests']} requests, "
+            f"error rate {report['error_rate']:.2%}, failed sync sessions {report['sessions_failed']}"))
@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.changelog import prune_changes
+from api.views import TABLE_MAPPING
+
+
+class Command(BaseCommand):
+    help = (
+        'Apply the change log retention policy: drop /api/changes entries older than --days and '
+        'beyond the newest --keep per table. Consumers whose cursor falls below what is kept '
+        'read a snapshot entry and must resync the table.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=getattr(settings, 'SYNC_CHANGE_RETENTION_DAYS', 30),
+                            help='Keep entries this many days (0: no age limit)')
+        parser.add_argument('--keep', type=int, default=getattr(settings, 'SYNC_CHANGE_RETENTION_ENTRIES', 1000000),
+                            help='Keep at most this many entries per table (0: no limit)')
+        parser.add_argument('--tables', nargs='+', choices=list(TABLE_MAPPING), help='Tables to prune (default: all)')
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['days']) if options['days'] else None
+        total = 0
+        for table_name in options['tables'] or TABLE_MAPPING:
+            pruned = prune_changes(table_name, before=before, keep=options['keep'] or None)
+            total += pruned
+            if pruned:
+                self.stdout.write(f'{table_name:<24}{pruned:>12} entries pruned')
+        self.stdout.write(self.style.SUCCESS(f'Pruned {total} change log entries'))
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.snapshots import SnapshotError, restore_snapshot
+from api.views import TABLE_MAPPING
+
+
+class Command(BaseCommand):
+    help = (
+        'Replace the synced tables with the contents of a snapshot_export file. '
+        'Tables are restored in parallel, each in its own transaction.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Snapshot file written by snapshot_export')
+        parser.add_argument('--tables', nargs='+', choices=list(TABLE_MAPPING),
+                            help='Tables to restore (default: every table in the snapshot)')
+        parser.add_argument('--workers', type=int, help='Tables restored at once (default: CPU count)')
+        parser.add_argument('--verify', action='store_true',
+                            help='Compare each restored table with the checksum recorded at export')
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        try:
+            manifest, results, errors = restore_snapshot(
+                options['path'], TABLE_MAPPING, tables=options['tables'],
+                workers=options['workers'], verify=options['verify'])
+        except SnapshotError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f"Snapshot from {manifest['created_at']} ({manifest['encoding']})")
+        for result in results:
+            self.stdout.write(f"{result['table']:<24}{result['rows']:>12} rows{result['seconds']:>10}s")
+        for table_name, error in errors.items():
+            self.stderr.write(f'{table_name}: {error}')
+        if errors:
+            raise CommandError(f'{len(errors)} tables failed to restore and were left unchanged: {list(errors)}')
+        self.stdout.write(self.style.SUCCESS(
+            f"Restored {len(results)} tables in {time.monotonic() - start:.2f}s"))
@@ -0,0 +1,79 @@
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.client import AdaptiveBatchSizer, SyncClient, SyncError, SOURCE_FORMATS, open_source
+
+
+class Command(BaseCommand):
+    help = 'Push a local CSV, NDJSON or SQLite source to a sync API server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('table', help='Target table, e.g. acc_product')
+        parser.add_argument('source', help='Path to the CSV, NDJSON or SQLite file')
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the sync API')
+        parser.add_argument('--format', choices=SOURCE_FORMATS, help='Source format (default: from extension)')
+        parser.add_argument('--query', help='SQL query to read from a SQLite source instead of the whole table')
+        parser.add_argument('--database', default='OMEGA')
+        parser.add_argument('--parallel', type=int, default=4, help='Concurrent uploads for middle batches')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Initial batch size')
+        parser.add_argument('--min-batch-size', type=int, default=500)
+        parser.add_argument('--max-batch-size', type=int, default=50000)
+        parser.add_argument('--target-seconds', type=float, default=2.0,
+                            help='Server time to aim for per batch when adapting the batch size')
+        parser.add_argument('--retries', type=int, default=5)
+        parser.add_argument('--no-compress', action='store_true', help='Send uncompressed JSON bodies')
+        parser.add_argument('--durability', choices=['full', 'relaxed', 'unlogged'],
+                            help='Durability tier for the load (default: the server setting for the table)')
+        parser.add_argument('--date-from', help='Replace only rows dated from this day (YYYY-MM-DD); '
+                                                 'for acc_invmast, acc_purchasemaster, acc_production and their details')
+        parser.add_argument('--date-to', help='... up to, not including, this day (YYYY-MM-DD)')
+        parser.add_argument('--if-changed', action='store_true',
+                            help='Compare table checksums first and skip the upload when nothing changed')
+        parser.add_argument('--buckets', type=int, default=0,
+                            help='With --if-changed, compare per key-range buckets and re-send only mismatches')
+
+    def handle(self, *args, **options):
+        logging.getLogger('api.client').setLevel(logging.INFO if options['verbosity'] > 1 else logging.WARNING)
+
+        sizer = AdaptiveBatchSizer(
+            initial=options['batch_size'],
+            minimum=options['min_batch_size'],
+            maximum=options['max_batch_size'],
+            target_seconds=options['target_seconds'],
+        )
+
+        try:
+            with SyncClient(
+                options['url'],
+                database=options['database'],
+                parallel=options['parallel'],
+                compress=not options['no_compress'],
+                max_retries=options['retries'],
+                batch_sizer=sizer,
+            ) as client:
+                table = options['table'].lower()
+                sync_options = {'durability': options['durability']} if options['durability'] else {}
+                if options['date_from'] or options['date_to']:
+                    if options['if_changed']:
+                        raise CommandError('--if-changed compares whole tables and cannot be combined with a date range')
+                    sync_options['date_range'] = {'from': options['date_from'], 'to': options['date_to']}
+                if options['if_changed']:
+                    records = open_source(options['source'], table, options['format'], options['query'])
+                    report = client.sync_table_if_changed(table, records, buckets=options['buckets'], **sync_options)
+                else:
+                    report = client.sync_source(
+                        table, options['source'], source_format=options['format'], query=options['query'],
+                        **sync_options)
+        except (SyncError, ValueError, OSError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(json.dumps(report, indent=2))
+        if report.get('skipped'):
+            self.stdout.write(self.style.SUCCESS(f"{report['table']} is unchanged, nothing sent"))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Synced {report['records_sent']} records to {report['table']} in "
+            f"{report['elapsed_seconds']}s ({report['records_per_second']} records/s, "
+            f"{report['batches']} batches)"))
@@ -0,0 +1,57 @@
+import io
+import logging
+import zlib
+
+from django.conf import settings
+from django.http import JsonResponse
+
+logger = logging.getLogger(__name__)
+
+
+class GzipRequestMiddleware:
+    """
+    Transparently decompress request bodies sent with Content-Encoding: gzip.
+
+    The sync client compresses its uploads; this lets the views keep parsing
+    plain JSON. The decompressed size is still bounded by
+    DATA_UPLOAD_MAX_MEMORY_SIZE so a small payload cannot expand without limit.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        encoding = request.META.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+        if encoding == 'gzip':
+            try:
+                body = self._decompress(request.body)
+            except (zlib.error, ValueError) as e:
+                logger.warning(f"Rejected gzip request body: {str(e)}")
+                return JsonResponse({
+                    'success': False,
+                    'error': f'Invalid gzip request body: {str(e)}'
+                }, status=400)
+
+            request._body = body
+            request._stream = io.BytesIO(body)
+            request.META['CONTENT_LENGTH'] = str(len(body))
+            del request.META['HTTP_CONTENT_ENCODING']
+
+        return self.get_response(request)
+
+    @staticmethod
+    def _decompress(data):
+        max_size = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+
+        if max_size is None:
+            body = decompressor.decompress(data)
+        else:
+            body = decompressor.decompress(data, max_size + 1)
+            if len(body) > max_size or decompressor.unconsumed_tail:
+                raise ValueError(
+                    f'decompressed body exceeds {max_size} bytes')
+
+        if not decompressor.eof:
+            raise ValueError('truncated gzip stream')
+        return body
@@ -0,0 +1,130 @@
+# Generated by Django 5.2.1
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccInvDetails',
+            fields=[
+                ('invno', models.DecimalField(decimal_places=0, max_digits=10)),
+                ('code', models.CharField(max_length=30, primary_key=True, serialize=False)),
+                ('quantity', models.DecimalField(decimal_places=5, max_digits=15)),
+            ],
+            options={
+                'db_table': 'acc_invdetails',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='AccInvMast',
+            fields=[
+                ('slno', models.DecimalField(decimal_places=0, max_digits=10, primary_key=True, serialize=False)),
+                ('invdate', models.DateField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'acc_invmast',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='AccProduct',
+            fields=[
+                ('code', models.CharField(max_length=30, primary_key=True, serialize=False)),
+                ('name', models.CharField(blank=True, max_length=200, null=True)),
+                ('quantity', models.DecimalField(blank=True, decimal_places=5, max_digits=15, null=True)),
+                ('openingquantity', models.DecimalField(blank=True, decimal_places=5, max_digits=15, null=True)),
+                ('stockcatagory', models.CharField(blank=True, max_length=20, null=True)),
+                ('unit', models.CharField(blank=True, max_length=10, null=True)),
+                ('product', models.CharField(blank=True, max_length=30, null=True)),
+                ('brand', models.CharField(blank=True, max_length=30, null=True)),
+                ('billedcost', models.DecimalField(blank=True, decimal_places=5, max_digits=14, null=True)),
+                ('basicprice', models.DecimalField(blank=True, decimal_places=5, max_digits=14, null=True)),
+                ('partqty', models.DecimalField(blank=True, decimal_places=5, max_digits=15, null=True)),
+            ],
+            options={
+                'db_table': 'acc_product',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='AccProduction',
+            fields=[
+                ('productionno', models.DecimalField(decimal_places=0, max_digits=20, primary_key=True, serialize=False)),
+                ('date', models.DateField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'acc_production',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='AccProductionDetails',
+            fields=[
+                ('masterno', models.DecimalField(decimal_places=0, max_digits=30, primary_key=True, serialize=False)),
+                ('code', models.CharField(max_length=30)),
+                ('qty', models.DecimalField(decimal_places=5, max_digits=15)),
+            ],
+            options={
+                'db_table': 'acc_productiondetails',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='AccPurchaseDetails',
+            fields=[
+                ('billno', models.DecimalField(decimal_places=0, max_digits=10, primary_key=True, serialize=False)),
+                ('code', models.CharField(max_length=30)),
+                ('quantity', models.DecimalField(decimal_places=5, max_digits=15)),
+            ],
+            options={
+                'db_table': 'acc_purchasedetails',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='AccPurchaseMaster',
+            fields=[
+                ('slno', models.DecimalField(decimal_places=0, max_digits=10, primary_key=True, serialize=False)),
+                ('date', models.DateField(blank=True, null=True)),
+                ('pdate', models.DateField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'acc_purchasemaster',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='AccUsers',
+            fields=[
+                ('id', models.CharField(max_length=30, primary_key=True, serialize=False)),
+                ('pass_field', models.CharField(db_column='pass', max_length=100)),
+                ('role', models.CharField(blank=True, max_length=30, null=True)),
+            ],
+            options={
+                'db_table': 'acc_users',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='SyncChange',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('table_name', models.CharField(max_length=64)),
+                ('op', models.CharField(choices=[('I', 'insert'), ('D', 'delete'), ('S', 'snapshot')], max_length=1)),
+                ('row_key', models.CharField(blank=True, max_length=100, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'sync_changes',
+                'indexes': [models.Index(fields=['table_name', 'seq'], name='sync_changes_table_seq_idx')],
+            },
+        ),
+    ]
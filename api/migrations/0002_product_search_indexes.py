@@ -0,0 +1,47 @@
+import logging
+
+from django.db import migrations, transaction
+
+logger = logging.getLogger(__name__)
+
+TRIGRAM_INDEXES = [
+    ('acc_product_name_trgm_idx', 'name'),
+    ('acc_product_brand_trgm_idx', 'brand'),
+    ('acc_product_product_trgm_idx', 'product'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """
+    Best effort: pg_trgm may not be installable (missing contrib package or
+    privileges) and acc_product is created outside Django. Without these
+    indexes product search falls back to the in-memory n-gram index.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            for index_name, column in TRIGRAM_INDEXES:
+                schema_editor.execute(
+                    f'CREATE INDEX IF NOT EXISTS {index_name} ON acc_product USING gin ({column} gin_trgm_ops)')
+    except Exception as e:
+        logger.warning(f"Skipping trigram indexes for product search: {str(e)}")
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for index_name, _ in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {index_name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,41 @@
+import logging
+
+from django.db import migrations, transaction
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = 'acc_product_code_trgm_idx'
+
+
+def create_code_index(apps, schema_editor):
+    """
+    Trigram index on code for the ILIKE 'prefix%' branch of product search;
+    without it that branch of the OR forces a sequential scan. Best effort,
+    like the indexes of 0002.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            schema_editor.execute(
+                f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON acc_product USING gin (code gin_trgm_ops)')
+    except Exception as e:
+        logger.warning(f"Skipping trigram index on acc_product.code: {str(e)}")
+
+
+def drop_code_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_product_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_code_index, drop_code_index),
+    ]
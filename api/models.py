@@ -88,4 +88,31 @@ class AccProductionDetails(models.Model):
 
     class Meta:
         db_table = 'acc_productiondetails'
-        managed = False
\ No newline at end of file
+        managed = False
+
+class SyncChange(models.Model):
+    """
+    Compact per-table change log written by the sync path. seq is the cursor
+    consumers pass back to /api/changes; a snapshot entry marks a full
+    truncate-reload after which consumers must resync the whole table.
+    """
+    OP_INSERT = 'I'
+    OP_DELETE = 'D'
+    OP_SNAPSHOT = 'S'
+    OP_CHOICES = [
+        (OP_INSERT, 'insert'),
+        (OP_DELETE, 'delete'),
+        (OP_SNAPSHOT, 'snapshot'),
+    ]
+
+    seq = models.BigAutoField(primary_key=True)
+    table_name = models.CharField(max_length=64)
+    op = models.CharField(max_length=1, choices=OP_CHOICES)
+    row_key = models.CharField(max_length=100, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'sync_changes'
+        indexes = [
+            models.Index(fields=['table_name', 'seq'], name='sync_changes_table_seq_idx'),
+        ]
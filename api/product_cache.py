@@ -0,0 +1,130 @@
+"""
+Per-worker product index for point-of-sale lookups by code.
+
+Products are kept as plain tuples in an LRU-ordered dict bounded by
+PRODUCT_CACHE_MAX_ENTRIES, so hot codes are answered from memory and cold
+ones are evicted. Codes that do not exist are cached too, so repeated misses
+do not reach the database either.
+
+The index is dropped when a sync of acc_product commits in this worker
+(changes_committed) and, for syncs handled by other workers or processes,
+when the change-log generation of acc_product moves; that check runs at most
+once every PRODUCT_CACHE_CHECK_SECONDS.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.dispatch import receiver
+
+from .changelog import changes_committed, latest_seq
+from .models import AccProduct
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = AccProduct._meta.db_table
+FIELDS = tuple(field.attname for field in AccProduct._meta.concrete_fields)
+
+# Placeholder stored for codes known not to exist
+NOT_FOUND = ()
+
+
+class ProductIndex:
+
+    def __init__(self, max_entries=None, check_seconds=None):
+        self.max_entries = max_entries or getattr(settings, 'PRODUCT_CACHE_MAX_ENTRIES', 100000)
+        self.check_seconds = check_seconds if check_seconds is not None else getattr(
+            settings, 'PRODUCT_CACHE_CHECK_SECONDS', 1.0)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = None
+        self._checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation = None
+            self._checked_at = 0.0
+        logger.info("Product index invalidated")
+
+    def _check_generation(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_seconds:
+            return
+        generation = latest_seq(TABLE_NAME)
+        with self._lock:
+            if generation != self._generation:
+                self._entries.clear()
+                self._generation = generation
+            self._checked_at = now
+
+    def _load(self, codes):
+        rows = {}
+        codes = list(codes)
+        for i in range(0, len(codes), 1000):
+            for values in AccProduct.objects.filter(code__in=codes[i:i + 1000]).values_list(*FIELDS):
+                rows[values[0]] = values
+        return rows
+
+    def get_many(self, codes):
+        """
+        Return {code: product tuple} for the codes that exist
+        """
+        self._check_generation()
+
+        found = {}
+        missing = []
+        with self._lock:
+            for code in codes:
+                values = self._entries.get(code)
+                if values is None:
+                    missing.append(code)
+                    continue
+                self._entries.move_to_end(code)
+                if values is not NOT_FOUND:
+                    found[code] = values
+            self.hits += len(codes) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            generation = self._generation
+            loaded = self._load(set(missing))
+            with self._lock:
+                # Do not cache rows read before an invalidation that raced us
+                if generation == self._generation:
+                    for code in missing:
+                        self._entries[code] = loaded.get(code, NOT_FOUND)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+            found.update(loaded)
+
+        return found
+
+    def get(self, code):
+        return self.get_many([code]).get(code)
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'generation': self._generation,
+        }
+
+
+def as_dict(values):
+    return dict(zip(FIELDS, values))
+
+
+product_index = ProductIndex()
+
+
+@receiver(changes_committed)
+def invalidate_on_product_sync(sender, table_name, **kwargs):
+    if table_name == TABLE_NAME:
+        product_index.invalidate()
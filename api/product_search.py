@@ -0,0 +1,294 @@
+"""
+Ranked product search over AccProduct code, name, brand and product.
+
+Two backends, chosen by PRODUCT_SEARCH_BACKEND ('auto', 'trigram', 'memory'):
+
+- trigram: PostgreSQL with the pg_trgm extension. GIN trigram indexes
+  (migrations 0002 and 0003) make ILIKE '%...%' index-assisted and similarity()
+  ranks the matches. The database maintains the indexes as rows change.
+- memory: a per-worker n-gram index, the portable fallback. It is built
+  once and then kept current incrementally from the change log: inserted
+  and deleted keys are applied, and only a snapshot (a full reload)
+  triggers a rebuild.
+
+'auto' uses trigram when pg_trgm is installed and memory otherwise.
+"""
+import heapq
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, connections, router
+from django.dispatch import receiver
+
+from .changelog import changes_committed, iter_changes, latest_seq
+from .models import AccProduct
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = AccProduct._meta.db_table
+SEARCH_FIELDS = ('code', 'name', 'brand', 'product')
+FIELD_WEIGHTS = {'code': 1.0, 'name': 1.0, 'brand': 0.6, 'product': 0.6}
+
+_whitespace = re.compile(r'\s+')
+
+
+def normalize(text):
+    return _whitespace.sub(' ', text).strip().lower() if text else ''
+
+
+def trigrams(text, padded=True):
+    """
+    pg_trgm style trigrams: with padding every word gets two leading blanks
+    and one trailing blank, so short prefixes become searchable too
+    """
+    grams = set()
+    if padded:
+        for word in text.split(' '):
+            if word:
+                word = f'  {word} '
+                grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    else:
+        grams.update(text[i:i + 3] for i in range(len(text) - 2))
+    return grams
+
+
+def text_grams(texts):
+    """
+    Everything indexed for one product: padded word trigrams for prefix
+    queries plus plain trigrams of each whole value, which also span word
+    boundaries and keep multi-word queries selective
+    """
+    grams = set()
+    for text in texts:
+        grams |= trigrams(text)
+        grams |= trigrams(text, padded=False)
+    return grams
+
+
+def match_score(text, query):
+    """
+    Rank one field: exact > prefix > word prefix > substring; shorter values
+    and earlier matches win ties
+    """
+    if not text:
+        return 0.0
+    position = text.find(query)
+    if position < 0:
+        return 0.0
+    if text == query:
+        score = 100.0
+    elif position == 0:
+        score = 60.0
+    elif text[position - 1] == ' ':
+        score = 40.0
+    else:
+        score = 20.0
+    return score - position / 100.0 - len(text) / 1000.0
+
+
+class NgramIndex:
+    """
+    In-memory trigram index of the searchable product fields
+    """
+
+    def __init__(self, check_seconds=None):
+        self.check_seconds = check_seconds if check_seconds is not None else getattr(
+            settings, 'PRODUCT_SEARCH_CHECK_SECONDS', 1.0)
+        self._lock = threading.Lock()
+        self._rows = {}        # code -> (code, name, brand, product)
+        self._texts = {}       # code -> normalized field values
+        self._postings = {}    # trigram -> set of codes
+        self._cursor = None
+        self._checked_at = 0.0
+
+    def mark_stale(self):
+        self._checked_at = 0.0
+
+    def _add(self, values):
+        code = values[0]
+        if code in self._rows:
+            self._remove(code)
+        texts = tuple(normalize(value) for value in values)
+        self._rows[code] = values
+        self._texts[code] = texts
+        for gram in text_grams(texts):
+            self._postings.setdefault(gram, set()).add(code)
+
+    def _remove(self, code):
+        texts = self._texts.pop(code, None)
+        self._rows.pop(code, None)
+        if texts is None:
+            return
+        for gram in text_grams(texts):
+            codes = self._postings.get(gram)
+            if codes is not None:
+                codes.discard(code)
+                if not codes:
+                    del self._postings[gram]
+
+    def _rebuild(self):
+        cursor = latest_seq(TABLE_NAME)
+        self._rows, self._texts, self._postings = {}, {}, {}
+        for values in AccProduct.objects.values_list(*SEARCH_FIELDS).iterator(chunk_size=5000):
+            self._add(values)
+        self._cursor = cursor
+        logger.info(f"Product search index rebuilt: {len(self._rows)} products at seq {cursor}")
+
+    def _apply_changes(self):
+        """
+        Apply change-log entries after the cursor; returns False when a
+        snapshot means the index has to be rebuilt instead
+        """
+        final_ops = {}
+        cursor = self._cursor
+        while True:
+            changes = list(iter_changes(TABLE_NAME, cursor, 10000))
+            for seq, op, key in changes[:10000]:
+                if op == 'snapshot':
+                    return False
+                final_ops.pop(key, None)
+                final_ops[key] = op
+                cursor = seq
+            if len(changes) <= 10000:
+                break
+
+        inserted = [key for key, op in final_ops.items() if op == 'insert']
+        loaded = {}
+        for i in range(0, len(inserted), 1000):
+            for values in AccProduct.objects.filter(code__in=inserted[i:i + 1000]).values_list(*SEARCH_FIELDS):
+                loaded[values[0]] = values
+
+        for key, op in final_ops.items():
+            if key in loaded:
+                self._add(loaded[key])
+            else:
+                self._remove(key)
+        self._cursor = cursor
+        if final_ops:
+            logger.info(f"Product search index updated: {len(final_ops)} keys up to seq {cursor}")
+        return True
+
+    def refresh(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_seconds:
+            return
+        with self._lock:
+            if self._cursor is None or not self._apply_changes():
+                self._rebuild()
+            self._checked_at = now
+
+    def search(self, query, limit=20):
+        self.refresh()
+        query = normalize(query)
+        if not query:
+            return []
+
+        with self._lock:
+            grams = trigrams(query, padded=False)
+            if not grams:
+                # Only short words: narrow down to words starting with them
+                grams = {gram for gram in trigrams(query) if not gram.endswith(' ')}
+            postings = sorted((self._postings.get(gram, set()) for gram in grams), key=len)
+            if not postings or not postings[0]:
+                return []
+            candidates = set(postings[0]).intersection(*postings[1:])
+
+            results = []
+            for code in candidates:
+                texts = self._texts[code]
+                score = max(match_score(text, query) * FIELD_WEIGHTS[field]
+                            for field, text in zip(SEARCH_FIELDS, texts))
+                if score > 0:
+                    results.append((score, self._rows[code]))
+
+        results = heapq.nsmallest(limit, results, key=lambda item: (-item[0], item[1][1] or '', item[1][0]))
+        return [
+            dict(zip(SEARCH_FIELDS, values), score=round(score, 3))
+            for score, values in results
+        ]
+
+
+def _like_escape(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def trigram_search(query, limit=20):
+    """
+    Ranked substring search with pg_trgm indexes
+    """
+    query = normalize(query)
+    if not query:
+        return []
+
+    db = connections[router.db_for_read(AccProduct)]
+    quote_name = db.ops.quote_name
+    columns = [quote_name(AccProduct._meta.get_field(field).column) for field in SEARCH_FIELDS]
+    code, name, brand, product = columns
+    params = {
+        'q': query,
+        'prefix': _like_escape(query) + '%',
+        'word_prefix': '% ' + _like_escape(query) + '%',
+        'contains': '%' + _like_escape(query) + '%',
+        'limit': limit,
+    }
+    sql = f"""
+        SELECT {code}, {name}, {brand}, {product},
+            (CASE
+                WHEN lower({code}) = %(q)s OR lower({name}) = %(q)s THEN 100
+                WHEN lower({code}) LIKE %(prefix)s OR lower({name}) LIKE %(prefix)s THEN 60
+                WHEN lower({name}) LIKE %(word_prefix)s THEN 40
+                ELSE 20
+            END) + GREATEST(COALESCE(similarity({name}, %(q)s), 0),
+                            COALESCE(similarity({brand}, %(q)s), 0),
+                            COALESCE(similarity({product}, %(q)s), 0)) AS score
+        FROM {quote_name(AccProduct._meta.db_table)}
+        WHERE {name} ILIKE %(contains)s OR {brand} ILIKE %(contains)s
+            OR {product} ILIKE %(contains)s OR {code} ILIKE %(prefix)s
+        ORDER BY score DESC, {name}, {code}
+        LIMIT %(limit)s
+    """
+    with db.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [
+            dict(zip(SEARCH_FIELDS, row[:4]), score=round(float(row[4]), 3))
+            for row in cursor.fetchall()
+        ]
+
+
+_trigram_available = None
+
+
+def search_backend():
+    global _trigram_available
+    backend = getattr(settings, 'PRODUCT_SEARCH_BACKEND', 'auto')
+    if backend != 'auto':
+        return backend
+    if connection.vendor != 'postgresql':
+        return 'memory'
+    if _trigram_available is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trigram_available = cursor.fetchone() is not None
+    return 'trigram' if _trigram_available else 'memory'
+
+
+ngram_index = NgramIndex()
+
+
+def search_products(query, limit=20):
+    """
+    Returns (backend name, ranked results)
+    """
+    backend = search_backend()
+    if backend == 'trigram':
+        return backend, trigram_search(query, limit)
+    return backend, ngram_index.search(query, limit)
+
+
+@receiver(changes_committed)
+def refresh_on_product_sync(sender, table_name, **kwargs):
+    if table_name == TABLE_NAME:
+        ngram_index.mark_stale()
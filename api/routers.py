@@ -0,0 +1,292 @@
+"""
+Read-replica routing for read-only endpoints.
+
+Views wrapped with read_only_endpoint read from one of the
+SYNC_REPLICA_DATABASES aliases, picked round robin once per request so all
+of its queries see the same replica. Other views and all writes use the
+primary (default). Some tables are read from the primary even then:
+
+- for SYNC_REPLICA_STICKY_SECONDS after a sync of a table commits
+  (changes_committed), that table and the change feed, so a client reads
+  its own writes. Other tables keep using the replica. A replica in use
+  passed its last check with at most SYNC_REPLICA_MAX_LAG_SECONDS of lag,
+  up to SYNC_REPLICA_CHECK_SECONDS ago, so the sticky period must cover
+  both (api.E002).
+- tables that are UNLOGGED (see durability.py), which standbys cannot
+  read, and for a while after they are logged again.
+- all of them when the chosen replica cannot be used: replicas are checked
+  at most every SYNC_REPLICA_CHECK_SECONDS, and one that cannot be reached
+  or replays more than SYNC_REPLICA_MAX_LAG_SECONDS behind its primary is
+  skipped until a later check passes.
+
+The markers are kept in the Django cache, so replicas are only used with
+a cache that every server process shares (not locmem or dummy); the
+api.E001 check reports the misconfiguration.
+
+A database that is not in recovery (e.g. a second local database standing
+in for a replica) reports no lag.
+"""
+import contextvars
+import functools
+import itertools
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.dispatch import receiver
+from django.http import StreamingHttpResponse
+
+from .changelog import changes_committed
+from .durability import UNLOGGED_TABLE_KEY
+from .models import SyncChange
+
+logger = logging.getLogger(__name__)
+
+RECENT_WRITE_KEY = 'sync:recent-write:{}'
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+UNLOGGED_TABLES_SQL = "SELECT relname FROM pg_class WHERE relpersistence = 'u' AND relkind IN ('r', 'p')"
+
+# Replay lag in seconds; 0 when not a standby or when replay has caught up
+# with everything received (pg_last_xact_replay_timestamp alone grows while
+# the primary is idle)
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+# Per-request routing state: None outside read-only endpoints, else a dict
+# holding the alias chosen for the request and the tables already looked up
+_request_state = contextvars.ContextVar('sync_replica_request', default=None)
+
+
+class ReplicaPool:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        self._healthy = []
+        self._status = {}
+        self._unlogged = set()
+        self._checked_at = None
+        self._warned = False
+
+    @property
+    def aliases(self):
+        return list(getattr(settings, 'SYNC_REPLICA_DATABASES', []))
+
+    def shared_cache(self):
+        return settings.CACHES['default']['BACKEND'] not in LOCAL_CACHE_BACKENDS
+
+    def _check(self, alias):
+        max_lag = getattr(settings, 'SYNC_REPLICA_MAX_LAG_SECONDS', 10.0)
+        db = connections[alias]
+        try:
+            with db.cursor() as cursor:
+                if db.vendor == 'postgresql':
+                    cursor.execute(LAG_SQL)
+                    lag = float(cursor.fetchone()[0] or 0)
+                else:
+                    cursor.execute('SELECT 1')
+                    lag = 0.0
+        except Exception as e:
+            db.close()
+            return {'healthy': False, 'error': str(e)}
+        return {'healthy': lag <= max_lag, 'lag_seconds': round(lag, 3)}
+
+    def _unlogged_tables(self):
+        """
+        Unlogged tables on the primary; covers markers lost from the cache
+        """
+        db = connections[DEFAULT_DB_ALIAS]
+        if db.vendor != 'postgresql':
+            return set()
+        try:
+            with db.cursor() as cursor:
+                cursor.execute(UNLOGGED_TABLES_SQL)
+                return {row[0] for row in cursor.fetchall()}
+        except Exception as e:
+            logger.warning(f"Cannot list unlogged tables: {str(e)}")
+            return self._unlogged
+
+    def refresh(self):
+        status = {alias: self._check(alias) for alias in self.aliases}
+        self._unlogged = self._unlogged_tables()
+        healthy = [alias for alias, result in status.items() if result['healthy']]
+        for alias in status:
+            if alias not in healthy and (alias in self._healthy or alias not in self._status):
+                logger.warning(f"Replica {alias} dropped: {status[alias]}")
+        for alias in set(healthy) - set(self._healthy):
+            logger.info(f"Replica {alias} in use: {status[alias]}")
+        self._status, self._healthy = status, healthy
+        self._checked_at = time.monotonic()
+
+    def healthy_aliases(self):
+        interval = getattr(settings, 'SYNC_REPLICA_CHECK_SECONDS', 5.0)
+        if self._checked_at is None or time.monotonic() - self._checked_at >= interval:
+            # Only the first check blocks; later ones run in one thread while
+            # the others keep using the previous result
+            if self._lock.acquire(blocking=self._checked_at is None):
+                try:
+                    if self._checked_at is None or time.monotonic() - self._checked_at >= interval:
+                        self.refresh()
+                finally:
+                    self._lock.release()
+        return self._healthy
+
+    def choose(self):
+        """
+        Replica alias for the next read-only request, or None for the primary
+        """
+        if not self.aliases:
+            return None
+        if not self.shared_cache():
+            if not self._warned:
+                logger.error("Replicas are configured without a shared cache backend; reading from the primary")
+                self._warned = True
+            return None
+        healthy = self.healthy_aliases()
+        if not healthy:
+            return None
+        return healthy[next(self._counter) % len(healthy)]
+
+    def primary_only(self, table_name):
+        """
+        Whether reads of a table must use the primary: it was synced in the
+        last SYNC_REPLICA_STICKY_SECONDS or it is (or just was) unlogged
+        """
+        if table_name in self._unlogged:
+            return True
+        markers = cache.get_many([RECENT_WRITE_KEY.format(table_name), UNLOGGED_TABLE_KEY.format(table_name)])
+        return bool(markers)
+
+    def status(self):
+        if self.aliases:
+            self.healthy_aliases()
+        return {
+            'configured': self.aliases,
+            'healthy': list(self._healthy),
+            'checks': dict(self._status),
+            'shared_cache': self.shared_cache(),
+            'unlogged_tables': sorted(self._unlogged),
+        }
+
+
+replica_pool = ReplicaPool()
+
+
+class ReplicaRouter:
+    """
+    DATABASE_ROUTERS entry; returns None (the default database) unless the
+    query runs inside a read_only_endpoint
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        if state is None:
+            return None
+        if 'alias' not in state:
+            state['alias'] = replica_pool.choose()
+            state['primary_only'] = {}
+        if state['alias'] is None:
+            return None
+        table_name = model._meta.db_table
+        if table_name not in state['primary_only']:
+            state['primary_only'][table_name] = replica_pool.primary_only(table_name)
+        return None if state['primary_only'][table_name] else state['alias']
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+
+def _iterate_read_only(iterator, state):
+    iterator = iter(iterator)
+    while True:
+        token = _request_state.set(state)
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _request_state.reset(token)
+        yield item
+
+
+def read_only_endpoint(view):
+    """
+    Route the reads of a view (placed under @api_view) to a replica. A
+    streaming response keeps the same replica while it is consumed.
+    """
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        state = {}
+        token = _request_state.set(state)
+        try:
+            response = view(*args, **kwargs)
+        finally:
+            _request_state.reset(token)
+        if isinstance(response, StreamingHttpResponse):
+            response.streaming_content = _iterate_read_only(response.streaming_content, state)
+        if state.get('alias'):
+            logger.debug(f"{view.__name__} read from {state['alias']}")
+        return response
+
+    return wrapper
+
+
+@receiver(changes_committed)
+def stick_to_primary_after_write(sender, table_name, **kwargs):
+    sticky = getattr(settings, 'SYNC_REPLICA_STICKY_SECONDS', 15.0)
+    if sticky > 0 and getattr(settings, 'SYNC_REPLICA_DATABASES', None):
+        cache.set_many({
+            RECENT_WRITE_KEY.format(table_name): True,
+            RECENT_WRITE_KEY.format(SyncChange._meta.db_table): True,
+        }, sticky)
+
+
+@checks.register(checks.Tags.caches, checks.Tags.database)
+def check_shared_cache(app_configs, **kwargs):
+    if getattr(settings, 'SYNC_REPLICA_DATABASES', None) and not replica_pool.shared_cache():
+        return [checks.Error(
+            'SYNC_REPLICA_DATABASES needs a cache backend shared by all server processes',
+            hint='Configure CACHES (e.g. Redis or Memcached); with a local cache reads stay on the primary.',
+            id='api.E001',
+        )]
+    return []
+
+
+def replay_window():
+    """
+    How far behind the primary a replica in use may be: the lag it was
+    allowed at its last check plus the time since that check
+    """
+    return (getattr(settings, 'SYNC_REPLICA_MAX_LAG_SECONDS', 10.0)
+            + getattr(settings, 'SYNC_REPLICA_CHECK_SECONDS', 5.0))
+
+
+@checks.register(checks.Tags.database)
+def check_sticky_window(app_configs, **kwargs):
+    sticky = getattr(settings, 'SYNC_REPLICA_STICKY_SECONDS', 15.0)
+    if getattr(settings, 'SYNC_REPLICA_DATABASES', None) and sticky < replay_window():
+        return [checks.Error(
+            f'SYNC_REPLICA_STICKY_SECONDS ({sticky}) is shorter than SYNC_REPLICA_MAX_LAG_SECONDS '
+            f'+ SYNC_REPLICA_CHECK_SECONDS ({replay_window()})',
+            hint='Reads would return to a replica that may not have replayed the sync yet.',
+            id='api.E002',
+        )]
+    return []
@@ -0,0 +1,295 @@
+"""
+Versioned snapshot files of the synced tables, for standing up a replica,
+test environment or branch server without replaying syncs through the API.
+
+A snapshot is a tar archive with a manifest.json and one gzip-compressed
+member per table:
+
+    <table>.copy.gz     PostgreSQL binary COPY of the table ('pg-binary')
+    <table>.ndjson.gz   one JSON array of column values per line ('ndjson',
+                        written on other backends)
+
+The manifest records the format version, the column list of every table,
+the SHA-256 of each uncompressed table stream and the table_checksum digest
+at export time, so a restore can verify both the file and the loaded rows.
+Export runs in a single REPEATABLE READ transaction, so all tables come
+from the same point in time. Restore loads tables in parallel, each on its
+own connection and transaction.
+"""
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import tarfile
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from itertools import islice
+
+from django.db import connection, connections, transaction
+
+from .changelog import record_snapshot
+from .checksums import ALGORITHM, table_checksum
+from .durability import FULL, prepare_truncated_table
+from .views import bulk_insert_optimized, copy_supported, truncate_table_fast
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 'omega-sync-snapshot'
+SNAPSHOT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+PG_BINARY = 'pg-binary'
+NDJSON = 'ndjson'
+MEMBER_SUFFIXES = {PG_BINARY: '.copy.gz', NDJSON: '.ndjson.gz'}
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class _HashingWriter:
+    """
+    File-like sink that hashes and counts everything written through it
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.sha256 = hashlib.sha256()
+        self.bytes = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.bytes += len(data)
+        return self.fileobj.write(data)
+
+
+class _HashingReader(io.BufferedIOBase):
+    """
+    Binary source that hashes and counts everything read through it
+    """
+
+    def __init__(self, fileobj):
+        super().__init__()
+        self.fileobj = fileobj
+        self.sha256 = hashlib.sha256()
+        self.bytes = 0
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.sha256.update(data)
+        self.bytes += len(data)
+        return data
+
+    read1 = read
+
+    def readable(self):
+        return True
+
+
+def _columns(Model):
+    return [field.column for field in Model._meta.concrete_fields]
+
+
+def _copy_sql(Model, direction):
+    quote_name = connection.ops.quote_name
+    columns = ', '.join(quote_name(column) for column in _columns(Model))
+    return f"COPY {quote_name(Model._meta.db_table)} ({columns}) {direction} (FORMAT binary)"
+
+
+def _select_tables(table_mapping, tables):
+    tables = [table.lower() for table in tables] if tables else list(table_mapping)
+    unknown = [table for table in tables if table not in table_mapping]
+    if unknown:
+        raise SnapshotError(f'Tables {unknown} are not supported. Supported tables: {list(table_mapping)}')
+    return tables
+
+
+def _dump_table(Model, encoding, out):
+    writer = _HashingWriter(out)
+    if encoding == PG_BINARY:
+        with connection.cursor() as cursor:
+            cursor.cursor.copy_expert(_copy_sql(Model, 'TO STDOUT'), writer)
+    else:
+        attnames = [field.attname for field in Model._meta.concrete_fields]
+        for row in Model.objects.values_list(*attnames).iterator(chunk_size=10000):
+            writer.write((json.dumps(row, default=str) + '\n').encode())
+    return writer
+
+
+def export_snapshot(path, table_mapping, tables=None, compress_level=1):
+    """
+    Write the tables to a snapshot file at path and return its manifest
+    """
+    tables = _select_tables(table_mapping, tables)
+    encoding = PG_BINARY if copy_supported() else NDJSON
+    manifest = {
+        'format': SNAPSHOT_FORMAT,
+        'version': SNAPSHOT_VERSION,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'database': connection.vendor,
+        'encoding': encoding,
+        'compression': 'gzip',
+        'checksum_algorithm': ALGORITHM,
+        'tables': {},
+    }
+    directory = os.path.dirname(os.path.abspath(path))
+    partial_path = f'{path}.partial'
+
+    try:
+        with transaction.atomic(), tarfile.open(partial_path, 'w') as tar:
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+            _write_tables(tar, tables, table_mapping, encoding, manifest, directory, compress_level)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+
+    os.replace(partial_path, path)
+    return manifest
+
+
+def _write_tables(tar, tables, table_mapping, encoding, manifest, directory, compress_level):
+    for table_name in tables:
+        Model = table_mapping[table_name]['model']
+        start = time.monotonic()
+        with tempfile.TemporaryFile(dir=directory) as tmp:
+            with gzip.GzipFile(fileobj=tmp, mode='wb', compresslevel=compress_level, mtime=0) as out:
+                writer = _dump_table(Model, encoding, out)
+            info = tarfile.TarInfo(table_name + MEMBER_SUFFIXES[encoding])
+            info.size = tmp.tell()
+            info.mtime = int(time.time())
+            tmp.seek(0)
+            tar.addfile(info, tmp)
+
+        checksum, _ = table_checksum(table_name, Model)
+        manifest['tables'][table_name] = {
+            'member': info.name,
+            'columns': _columns(Model),
+            'rows': checksum['record_count'],
+            'digest': checksum['digest'],
+            'sha256': writer.sha256.hexdigest(),
+            'bytes': writer.bytes,
+            'compressed_bytes': info.size,
+        }
+        logger.info(
+            f"Exported {checksum['record_count']} rows of {table_name} "
+            f"({writer.bytes} bytes, {info.size} compressed) in {time.monotonic() - start:.2f}s")
+
+    data = json.dumps(manifest, indent=2).encode()
+    info = tarfile.TarInfo(MANIFEST_NAME)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    tar.addfile(info, io.BytesIO(data))
+
+
+def read_manifest(path):
+    try:
+        with tarfile.open(path) as tar:
+            manifest = json.load(tar.extractfile(MANIFEST_NAME))
+    except (tarfile.TarError, KeyError, ValueError) as e:
+        raise SnapshotError(f'{path} is not a readable snapshot: {str(e)}')
+    if manifest.get('format') != SNAPSHOT_FORMAT:
+        raise SnapshotError(f'{path} is not a {SNAPSHOT_FORMAT} file')
+    if manifest.get('version', 0) > SNAPSHOT_VERSION:
+        raise SnapshotError(
+            f"{path} has snapshot version {manifest['version']}; this server reads up to {SNAPSHOT_VERSION}")
+    return manifest
+
+
+def _load_ndjson(Model, reader, batch_size=5000):
+    lines = io.TextIOWrapper(reader, encoding='utf-8')
+    total_inserted = 0
+    while True:
+        batch = [tuple(json.loads(line)) for line in islice(lines, batch_size)]
+        if not batch:
+            lines.detach()
+            return total_inserted
+        total_inserted += bulk_insert_optimized(Model, batch, batch_size=batch_size)
+
+
+def restore_table(path, table_name, Model, entry, encoding, verify=False):
+    """
+    Replace one table with its snapshot member in a single transaction.
+    Runs in a worker thread, on that thread's own connection.
+    """
+    start = time.monotonic()
+    try:
+        with tarfile.open(path) as tar, transaction.atomic():
+            reader = _HashingReader(gzip.GzipFile(fileobj=tar.extractfile(entry['member']), mode='rb'))
+            truncate_table_fast(Model)
+            prepare_truncated_table(Model, FULL)
+            if encoding == PG_BINARY:
+                with connection.cursor() as cursor:
+                    cursor.cursor.copy_expert(_copy_sql(Model, 'FROM STDIN'), reader)
+            else:
+                _load_ndjson(Model, reader)
+            reader.read()
+
+            if reader.sha256.hexdigest() != entry['sha256']:
+                raise SnapshotError(f'{table_name}: data does not match its SHA-256, the snapshot is damaged')
+            record_snapshot(table_name)
+
+            if verify:
+                checksum, _ = table_checksum(table_name, Model)
+                if checksum['digest'] != entry['digest'] or checksum['record_count'] != entry['rows']:
+                    raise SnapshotError(
+                        f"{table_name}: restored {checksum['record_count']} rows with digest "
+                        f"{checksum['digest']}, expected {entry['rows']} rows with digest {entry['digest']}")
+
+        elapsed = time.monotonic() - start
+        logger.info(f"Restored {entry['rows']} rows of {table_name} in {elapsed:.2f}s")
+        return {'table': table_name, 'rows': entry['rows'], 'seconds': round(elapsed, 2)}
+    finally:
+        connections.close_all()
+
+
+def restore_snapshot(path, table_mapping, tables=None, workers=None, verify=False):
+    """
+    Restore the tables of a snapshot file, several at a time on PostgreSQL.
+    Each table is replaced atomically; returns (manifest, results, errors)
+    where errors maps table names to messages.
+    """
+    manifest = read_manifest(path)
+    encoding = manifest['encoding']
+    tables = _select_tables(table_mapping, tables or list(manifest['tables']))
+    missing = [table for table in tables if table not in manifest['tables']]
+    if missing:
+        raise SnapshotError(f'Tables {missing} are not in the snapshot')
+    if encoding == PG_BINARY and not copy_supported():
+        raise SnapshotError('pg-binary snapshots can only be restored into PostgreSQL')
+    if encoding not in MEMBER_SUFFIXES:
+        raise SnapshotError(f'Unknown snapshot encoding {encoding!r}')
+
+    for table_name in tables:
+        expected = _columns(table_mapping[table_name]['model'])
+        if manifest['tables'][table_name]['columns'] != expected:
+            raise SnapshotError(f'{table_name}: snapshot columns do not match the table ({expected})')
+
+    # SQLite allows one writer at a time
+    if connection.vendor != 'postgresql':
+        workers = 1
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tables)))
+    # Largest tables first, so the longest loads do not start last
+    tables.sort(key=lambda table: -manifest['tables'][table]['compressed_bytes'])
+
+    results = []
+    errors = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='snapshot-restore') as executor:
+        futures = {
+            executor.submit(restore_table, path, table_name, table_mapping[table_name]['model'],
+                            manifest['tables'][table_name], encoding, verify): table_name
+            for table_name in tables
+        }
+        for future, table_name in futures.items():
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger.error(f"Restore of {table_name} failed: {str(e)}")
+                errors[table_name] = str(e)
+
+    return manifest, results, errors
@@ -1,3 +1,784 @@
-from django.test import TestCase
+"""
+Tests for the sync API. They run on SQLite as well as PostgreSQL:
 
-# Create your tests here.
+    python manage.py test api --settings=omegaapi.settings_loadtest
+
+The synced tables are unmanaged (they belong to the OMEGA database), so
+the test database gets them from setUpModule.
+"""
+import csv
+import gzip
+import io
+import json
+import os
+import tarfile
+import tempfile
+import time
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, router
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from . import checksums, routers, validation_pool
+from .changelog import changes_committed, prune_changes, record_inserts, record_snapshot
+from .client import compute_digest
+from .date_ranges import parse_date_range, records_outside_range, replace_date_range
+from .durability import RELAXED, UNLOGGED, UNLOGGED_TABLE_KEY
+from .loadtest import percentile
+from .product_cache import ProductIndex, product_index
+from .snapshots import MANIFEST_NAME, SnapshotError, export_snapshot, restore_snapshot
+from .middleware import GzipRequestMiddleware
+from .models import AccInvDetails, AccInvMast, AccProduct, AccUsers, SyncChange
+from .views import (
+    TABLE_MAPPING, ParallelInsertAborted, bulk_insert_optimized, bulk_insert_parallel, copy_csv_field,
+    fast_validate_and_process_data,
+)
+
+
+def unmanaged_models():
+    return [Model for Model in apps.get_app_config('api').get_models() if not Model._meta.managed]
+
+
+def setUpModule():
+    existing = set(connection.introspection.table_names())
+    with connection.schema_editor() as editor:
+        for Model in unmanaged_models():
+            if Model._meta.db_table in existing:
+                continue
+            if Model is AccInvDetails:
+                # As in OMEGA, without a key: code is the product code and
+                # repeats across invoices
+                columns = ', '.join(f'{editor.quote_name(field.column)} {field.db_type(connection)}'
+                                    for field in Model._meta.concrete_fields)
+                editor.execute(f'CREATE TABLE {editor.quote_name(Model._meta.db_table)} ({columns})')
+            else:
+                editor.create_model(Model)
+
+
+def tearDownModule():
+    with connection.schema_editor() as editor:
+        for Model in unmanaged_models():
+            editor.delete_model(Model)
+
+
+def load(table_name, records):
+    """
+    Validate and insert records the way sync_data does; returns the rows
+    """
+    rows, errors = fast_validate_and_process_data(records, table_name)
+    assert not errors, errors
+    bulk_insert_optimized(TABLE_MAPPING[table_name]['model'], rows)
+    return rows
+
+
+class ChecksumParityTests(TestCase):
+    """
+    compute_digest over the source records must match the server digest of
+    what it stored
+    """
+
+    users = [
+        {'id': ' u1 ', 'pass_field': 'secret ', 'role': ''},
+        {'id': 'u2', 'pass_field': 'x', 'role': None},
+        {'id': 'u3', 'pass_field': 'y', 'role': ' admin'},
+    ]
+    products = [
+        {'code': f'P{i:03d}', 'name': '' if i % 3 == 0 else (None if i % 3 == 1 else f'Product {i}'),
+         'quantity': '1.123456', 'billedcost': 2, 'basicprice': '3.10', 'unit': '\\N'}
+        for i in range(40)
+    ]
+
+    def setUp(self):
+        cache.clear()
+
+    def checksum(self, table_name, buckets=0):
+        response = self.client.get(f'/api/tables/{table_name}/checksum?buckets={buckets}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def assertDigestsMatch(self, table_name, records, buckets):
+        remote = self.checksum(table_name, buckets)
+        local = compute_digest(records, remote)
+        self.assertEqual(local['record_count'], remote['record_count'])
+        self.assertEqual(local['digest'], remote['digest'])
+        self.assertEqual([b['digest'] for b in local.get('buckets', [])],
+                         [b['digest'] for b in remote.get('buckets', [])])
+
+    def test_whole_table_digest_matches(self):
+        load('acc_users', self.users)
+        load('acc_product', self.products)
+        self.assertDigestsMatch('acc_users', self.users, buckets=0)
+        self.assertDigestsMatch('acc_product', self.products, buckets=0)
+
+    def test_bucket_digests_match(self):
+        load('acc_users', self.users)
+        load('acc_product', self.products)
+        self.assertDigestsMatch('acc_users', self.users, buckets=2)
+        self.assertDigestsMatch('acc_product', self.products, buckets=3)
+        self.assertEqual(len(self.checksum('acc_product', 3)['buckets']), 3)
+
+    def test_changed_record_is_found_in_its_bucket(self):
+        load('acc_product', self.products)
+        remote = self.checksum('acc_product', 4)
+        changed = [dict(record) for record in self.products]
+        changed[-1]['name'] = 'Renamed'
+        local = compute_digest(changed, remote)
+        self.assertNotEqual(local['digest'], remote['digest'])
+        mismatched = [remote_bucket['bucket'] for remote_bucket, local_bucket in zip(remote['buckets'], local['buckets'])
+                      if remote_bucket['digest'] != local_bucket['digest']]
+        self.assertEqual(mismatched, [3])
+
+    def test_columns_describe_the_stored_form(self):
+        load('acc_users', self.users)
+        columns = {column['name']: column for column in self.checksum('acc_users')['columns']}
+        self.assertTrue(columns['id'].get('strip'))
+        columns = {column['name']: column for column in self.checksum('acc_product')['columns']}
+        self.assertEqual(columns['quantity']['decimal_places'], 5)
+        self.assertNotIn('strip', columns['name'])
+
+
+class ValidationPoolTests(TestCase):
+
+    def records(self, count):
+        return [{'code': f'K{i:06d}', 'name': f'n {i}', 'quantity': str(i / 4)} for i in range(count)]
+
+    def test_rows_are_positional_in_field_order(self):
+        rows, errors = fast_validate_and_process_data([{'quantity': '1.5', 'code': 'A', 'unit': 'PCS'}], 'acc_product')
+        self.assertEqual(errors, [])
+        fields = [field.attname for field in AccProduct._meta.concrete_fields]
+        row = dict(zip(fields, rows[0]))
+        self.assertEqual(row['code'], 'A')
+        self.assertEqual(row['quantity'], Decimal('1.5'))
+        self.assertEqual(row['unit'], 'PCS')
+        self.assertIsNone(row['name'])
+
+    def test_unknown_fields_are_validation_errors(self):
+        rows, errors = fast_validate_and_process_data([{'code': 'A', 'colour': 'red'}], 'acc_product')
+        self.assertEqual(rows, [])
+        self.assertEqual(errors[0]['error'], 'Unknown field "colour"')
+
+    def test_encode_rows_sends_decimals_and_dates_as_text(self):
+        rows = [('A', Decimal('1.50'), date(2024, 1, 2), None, 7)]
+        self.assertEqual(validation_pool.encode_rows(rows), [('A', '1.50', '2024-01-02', None, 7)])
+
+    def test_encoded_rows_insert_like_the_originals(self):
+        rows, _ = fast_validate_and_process_data(self.records(3), 'acc_product')
+        bulk_insert_optimized(AccProduct, validation_pool.encode_rows(rows))
+        self.assertEqual(list(AccProduct.objects.order_by('code').values_list('quantity', flat=True)),
+                         [Decimal('0'), Decimal('0.25'), Decimal('0.5')])
+
+    def test_chunk_errors_point_into_the_payload(self):
+        records = self.records(4)
+        records[1]['code'] = ''
+        records[3]['quantity'] = 'abc'
+        rows, errors = validation_pool._validate_chunk('acc_product', 5000, records)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual([error['record_index'] for error in errors], [5001, 5003])
+
+    @override_settings(SYNC_VALIDATION_POOL_WORKERS=1, SYNC_VALIDATION_POOL_MIN_ROWS=1)
+    def test_single_worker_validates_in_process(self):
+        with mock.patch.object(validation_pool, 'get_pool', side_effect=AssertionError('pool used')):
+            rows, errors = validation_pool.validate_records(self.records(10), 'acc_product')
+        self.assertEqual((len(rows), errors), (10, []))
+
+    def test_default_pool_size_is_a_share_of_the_cpus(self):
+        with mock.patch('os.cpu_count', return_value=16), mock.patch.dict('os.environ', {'WEB_CONCURRENCY': '8'}):
+            self.assertEqual(validation_pool.pool_workers(), 2)
+        with mock.patch('os.cpu_count', return_value=64), mock.patch.dict('os.environ', {'WEB_CONCURRENCY': '1'}):
+            self.assertEqual(validation_pool.pool_workers(), validation_pool.DEFAULT_MAX_WORKERS)
+
+    @override_settings(SYNC_VALIDATION_POOL_WORKERS=2, SYNC_VALIDATION_POOL_MIN_ROWS=1)
+    def test_pool_matches_in_process_validation(self):
+        self.addCleanup(validation_pool._reset_pool)
+        records = self.records(12000)
+        for index in (0, 7000, 11999):
+            records[index]['quantity'] = 'bad'
+        expected_rows, expected_errors = fast_validate_and_process_data(records, 'acc_product')
+
+        rows, errors = validation_pool.validate_records(records, 'acc_product')
+
+        self.assertEqual(rows, validation_pool.encode_rows(expected_rows))
+        self.assertEqual([error['record_index'] for error in errors], [0, 7000, 11999])
+        self.assertEqual(errors, expected_errors)
+
+    @override_settings(SYNC_VALIDATION_POOL_WORKERS=2, SYNC_VALIDATION_POOL_MIN_ROWS=1)
+    def test_pool_is_restarted_after_a_reset(self):
+        self.addCleanup(validation_pool._reset_pool)
+        records = self.records(10)
+        pool = validation_pool.get_pool()
+        validation_pool._reset_pool()
+
+        rows, errors = validation_pool.validate_records(records, 'acc_product')
+
+        self.assertIsNot(validation_pool.get_pool(), pool)
+        self.assertEqual((len(rows), errors), (10, []))
+
+
+class DateRangeTests(TestCase):
+
+    january = (date(2024, 1, 1), date(2024, 2, 1))
+
+    def setUp(self):
+        load('acc_invmast', [
+            {'slno': 1, 'invdate': '2024-01-10'},
+            {'slno': 2, 'invdate': '2024-02-10'},
+            {'slno': 3, 'invdate': '2024-02-20'},
+        ])
+        load('acc_invdetails', [
+            {'code': 'D1', 'invno': 1, 'quantity': 1},
+            {'code': 'D2', 'invno': 2, 'quantity': 2},
+            {'code': 'D3', 'invno': 3, 'quantity': 3},
+        ])
+
+    def masters(self):
+        return sorted(int(slno) for slno in AccInvMast.objects.values_list('slno', flat=True))
+
+    def details(self):
+        return sorted(AccInvDetails.objects.values_list('code', flat=True))
+
+    def test_parse_date_range(self):
+        self.assertEqual(parse_date_range({'from': '2024-01-01', 'to': '2024-02-01'}), self.january)
+        self.assertEqual(parse_date_range({'from': '2024-01-01'}), (date(2024, 1, 1), None))
+        self.assertEqual(parse_date_range({'to': '2024-02-01'}), (None, date(2024, 2, 1)))
+        for value in (None, '2024-01-01', {}, {'from': None}, {'from': '2024-01-01', 'until': '2024-02-01'},
+                      {'from': '01/01/2024'}, {'to': 20240201}, {'from': '2024-02-01', 'to': '2024-01-01'}):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                parse_date_range(value)
+
+    def test_master_first_batch_replaces_the_range_and_resent_keys(self):
+        rows, errors = fast_validate_and_process_data(
+            [{'slno': 2, 'invdate': '2024-01-15'}, {'slno': 4, 'invdate': '2024-01-20'}], 'acc_invmast')
+        self.assertEqual(errors, [])
+
+        deleted = replace_date_range(TABLE_MAPPING, 'acc_invmast', rows, *self.january, is_first_batch=True)
+
+        self.assertEqual(sorted(int(key) for key in deleted['acc_invmast']), [1, 2])
+        self.assertEqual(sorted(int(key) for key in deleted['acc_invdetails']), [1, 2])
+        self.assertEqual(self.masters(), [3])
+        self.assertEqual(self.details(), ['D3'])
+
+    def test_later_master_batch_only_replaces_resent_keys(self):
+        rows, _ = fast_validate_and_process_data([{'slno': 2, 'invdate': '2024-01-15'}], 'acc_invmast')
+
+        deleted = replace_date_range(TABLE_MAPPING, 'acc_invmast', rows, *self.january, is_first_batch=False)
+
+        self.assertEqual([int(key) for key in deleted['acc_invmast']], [2])
+        self.assertEqual(self.masters(), [1, 3])
+        self.assertEqual(self.details(), ['D1', 'D3'])
+
+    def test_detail_first_batch_deletes_details_of_masters_in_range(self):
+        rows, _ = fast_validate_and_process_data([{'code': 'D4', 'invno': 1, 'quantity': 4}], 'acc_invdetails')
+
+        deleted = replace_date_range(TABLE_MAPPING, 'acc_invdetails', rows, date(2024, 2, 1), None,
+                                     is_first_batch=True)
+
+        self.assertEqual(list(deleted), ['acc_invdetails'])
+        self.assertEqual(sorted(int(key) for key in deleted['acc_invdetails']), [2, 3])
+        self.assertEqual(self.masters(), [1, 2, 3])
+        self.assertEqual(self.details(), ['D1'])
+        self.assertEqual(replace_date_range(TABLE_MAPPING, 'acc_invdetails', rows, date(2024, 2, 1), None,
+                                            is_first_batch=False), {})
+
+    def test_details_sharing_a_code_outside_the_range_are_kept(self):
+        load('acc_invdetails', [
+            {'code': 'SOAP', 'invno': 1, 'quantity': 1},
+            {'code': 'SOAP', 'invno': 3, 'quantity': 2},
+        ])
+        february = (date(2024, 2, 1), None)
+
+        rows, _ = fast_validate_and_process_data([{'slno': 3, 'invdate': '2024-02-21'}], 'acc_invmast')
+        deleted = replace_date_range(TABLE_MAPPING, 'acc_invmast', rows, *february, is_first_batch=True)
+        self.assertEqual(sorted(int(key) for key in deleted['acc_invdetails']), [2, 3, 3])
+
+        rows, _ = fast_validate_and_process_data([{'code': 'SOAP', 'invno': 3, 'quantity': 2}], 'acc_invdetails')
+        replace_date_range(TABLE_MAPPING, 'acc_invdetails', rows, *february, is_first_batch=True)
+
+        self.assertEqual(list(AccInvDetails.objects.order_by('code').values_list('code', 'invno')),
+                         [('D1', 1), ('SOAP', 1)])
+
+    def test_records_outside_range(self):
+        rows, _ = fast_validate_and_process_data([
+            {'slno': 5, 'invdate': '2024-01-31'},
+            {'slno': 6, 'invdate': '2024-02-01'},
+            {'slno': 7, 'invdate': None},
+            {'slno': 8, 'invdate': '2023-12-31'},
+        ], 'acc_invmast')
+        self.assertEqual(records_outside_range(TABLE_MAPPING, 'acc_invmast', rows, *self.january), [1, 2, 3])
+
+        rows, _ = fast_validate_and_process_data([
+            {'code': 'D5', 'invno': 1, 'quantity': 1},
+            {'code': 'D6', 'invno': 2, 'quantity': 1},
+        ], 'acc_invdetails')
+        self.assertEqual(records_outside_range(TABLE_MAPPING, 'acc_invdetails', rows, *self.january), [1])
+
+
+class ParallelInsertTests(TransactionTestCase):
+    """
+    Each bulk_insert_parallel worker commits on its own connection, so these
+    run outside a test transaction (flush leaves the unmanaged tables alone).
+    Only one share writes, as SQLite takes a single writer at a time.
+    """
+
+    def setUp(self):
+        self.rows, _ = fast_validate_and_process_data(
+            [{'code': f'C{i:03d}', 'quantity': i} for i in range(20)], 'acc_product')
+
+    def tearDown(self):
+        AccProduct.objects.all().delete()
+        SyncChange.objects.all().delete()
+
+    def insert_shares(self, first_share):
+        """
+        Patch bulk_insert_optimized so the first share runs first_share and
+        the others insert for real
+        """
+        first_key = self.rows[0][0]
+
+        def insert(Model, share, **kwargs):
+            if share[0][0] == first_key:
+                return first_share(Model, share, **kwargs)
+            return bulk_insert_optimized(Model, share, **kwargs)
+
+        return mock.patch('api.views.bulk_insert_optimized', side_effect=insert)
+
+    def test_failed_share_rolls_back_every_share(self):
+        def fail(Model, share, **kwargs):
+            raise ValueError('share failed')
+
+        with self.insert_shares(fail), self.assertRaisesMessage(ValueError, 'share failed'):
+            bulk_insert_parallel(AccProduct, self.rows, workers=2, feed_table='acc_product')
+        self.assertEqual(AccProduct.objects.count(), 0)
+        self.assertFalse(SyncChange.objects.exists())
+
+    def test_share_missing_the_commit_point_aborts(self):
+        def stall(Model, share, **kwargs):
+            time.sleep(0.5)
+            return len(share)
+
+        with self.insert_shares(stall), self.assertRaises(ParallelInsertAborted):
+            bulk_insert_parallel(AccProduct, self.rows, workers=2, timeout=0.2, feed_table='acc_product')
+        self.assertEqual(AccProduct.objects.count(), 0)
+        self.assertFalse(SyncChange.objects.exists())
+
+
+@override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=1000)
+class GzipRequestMiddlewareTests(SimpleTestCase):
+
+    def post(self, body, **headers):
+        middleware = GzipRequestMiddleware(lambda request: HttpResponse(request.body))
+        request = RequestFactory().post('/api/sync', body, content_type='application/json', **headers)
+        return middleware(request)
+
+    def test_body_at_the_limit_is_decompressed(self):
+        body = b'x' * 1000
+        response = self.post(gzip.compress(body), HTTP_CONTENT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, body)
+
+    def test_body_over_the_limit_is_rejected(self):
+        response = self.post(gzip.compress(b'x' * 1001), HTTP_CONTENT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(b'exceeds 1000 bytes', response.content)
+
+    def test_truncated_stream_is_rejected(self):
+        response = self.post(gzip.compress(b'x' * 500)[:-10], HTTP_CONTENT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(b'truncated gzip stream', response.content)
+
+    def test_invalid_stream_is_rejected(self):
+        response = self.post(b'not gzip', HTTP_CONTENT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 400)
+
+    def test_plain_body_is_untouched(self):
+        response = self.post(b'{"table": "acc_product"}')
+        self.assertEqual(response.content, b'{"table": "acc_product"}')
+
+
+class ChangeFeedTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        rows, _ = fast_validate_and_process_data([{'code': f'F{i}'} for i in range(5)], 'acc_product')
+        record_inserts('acc_product', AccProduct, rows)
+
+    def changes(self, since=0, limit=2):
+        response = self.client.get(f'/api/changes?table=acc_product&since={since}&limit={limit}')
+        self.assertEqual(response.status_code, 200)
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        return lines[:-1], lines[-1]
+
+    def test_pages_follow_the_cursor(self):
+        keys = []
+        since = 0
+        pages = 0
+        while True:
+            changes, tail = self.changes(since)
+            pages += 1
+            self.assertLessEqual(len(changes), 2)
+            keys += [change['key'] for change in changes]
+            self.assertTrue(all(change['op'] == 'insert' for change in changes))
+            if changes:
+                self.assertEqual(tail['next_cursor'], changes[-1]['seq'])
+            since = tail['next_cursor']
+            if not tail['has_more']:
+                break
+        self.assertEqual(keys, [f'F{i}' for i in range(5)])
+        self.assertEqual(pages, 3)
+
+    def test_cursor_at_the_end_reads_nothing(self):
+        changes, tail = self.changes(limit=5)
+        self.assertFalse(tail['has_more'])
+        self.assertEqual(self.changes(since=tail['next_cursor']), ([], {'next_cursor': tail['next_cursor'],
+                                                                         'has_more': False}))
+
+    def test_invalid_parameters_are_rejected(self):
+        for query in ('table=acc_product&limit=0', 'table=acc_product&limit=100001',
+                      'table=acc_product&limit=x', 'table=acc_product&since=-1', 'table=nope', ''):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f'/api/changes?{query}').status_code, 400)
+
+    def test_snapshot_supersedes_older_changes(self):
+        seq = record_snapshot('acc_product')
+        changes, tail = self.changes(limit=10)
+        self.assertEqual(changes, [{'seq': seq, 'op': 'snapshot', 'key': None}])
+
+    def test_pruned_cursor_reads_a_snapshot(self):
+        old_changes, _ = self.changes(limit=10)
+
+        self.assertEqual(prune_changes('acc_product', keep=2), 3)
+
+        changes, tail = self.changes(since=old_changes[0]['seq'], limit=10)
+        self.assertEqual([change['op'] for change in changes], ['snapshot', 'insert', 'insert'])
+        self.assertEqual(changes[0]['seq'], old_changes[2]['seq'])
+        self.assertEqual([change['key'] for change in changes[1:]], ['F3', 'F4'])
+        # A consumer that had already read past the pruned entries sees no snapshot
+        changes, _ = self.changes(since=old_changes[2]['seq'], limit=10)
+        self.assertEqual([change['key'] for change in changes], ['F3', 'F4'])
+
+
+class BulkLoadTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'products.csv')
+        self.checkpoint = f'{self.path}.acc_product.checkpoint.json'
+
+    def write_csv(self, codes):
+        with open(self.path, 'w') as f:
+            f.write('code,quantity\n')
+            f.writelines(f'{code},1\n' for code in codes)
+
+    def bulk_load(self, *args):
+        call_command('bulk_load', 'acc_product', self.path, '--workers', '1', *args, stdout=io.StringIO(),
+                     stderr=io.StringIO())
+
+    def codes(self):
+        return list(AccProduct.objects.order_by('code').values_list('code', flat=True))
+
+    def fail_in_third_chunk(self):
+        codes = [f'B{i}' for i in range(10)]
+        self.write_csv(codes[:5] + [''] + codes[6:])
+        with self.assertRaisesMessage(CommandError, 'chunk 2'):
+            self.bulk_load('--chunk-size', '2')
+        self.assertEqual(self.codes(), codes[:4])
+        self.write_csv(codes)
+        return codes
+
+    def test_resume_loads_each_record_once(self):
+        codes = self.fail_in_third_chunk()
+
+        self.bulk_load('--chunk-size', '2')
+
+        self.assertEqual(self.codes(), codes)
+        self.assertEqual(SyncChange.objects.filter(table_name='acc_product', op=SyncChange.OP_INSERT).count(), 10)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_resume_with_another_chunk_size_is_rejected(self):
+        codes = self.fail_in_third_chunk()
+
+        with self.assertRaisesMessage(CommandError, '--chunk-size 2'):
+            self.bulk_load('--chunk-size', '3')
+        self.assertEqual(self.codes(), codes[:4])
+
+        self.bulk_load('--chunk-size', '3', '--restart')
+        self.assertEqual(self.codes(), codes)
+
+    def test_append_of_an_empty_source(self):
+        self.write_csv([])
+        self.bulk_load('--append')
+        self.assertEqual(self.codes(), [])
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+
+class CopyCsvFieldTests(SimpleTestCase):
+
+    def test_text_is_always_quoted(self):
+        self.assertEqual(copy_csv_field(''), '""')
+        self.assertEqual(copy_csv_field('\\N'), '"\\N"')
+        self.assertEqual(copy_csv_field('say "hi", twice'), '"say ""hi"", twice"')
+        self.assertEqual(copy_csv_field(Decimal('1.50')), '"1.50"')
+
+    def test_null_is_the_unquoted_empty_field(self):
+        self.assertEqual(copy_csv_field(None), '')
+        self.assertEqual(','.join(map(copy_csv_field, ('a', None, ''))), '"a",,""')
+
+    def test_fields_read_back_as_sent(self):
+        values = ['plain', 'line\nbreak', 'comma, quote "', '\\N', '']
+        line = ','.join(map(copy_csv_field, values)) + '\n'
+        self.assertEqual(next(csv.reader(io.StringIO(line))), values)
+
+
+class ReplicaSettingsCheckTests(SimpleTestCase):
+
+    @override_settings(SYNC_REPLICA_DATABASES=['replica_1'], SYNC_REPLICA_STICKY_SECONDS=5.0,
+                       SYNC_REPLICA_MAX_LAG_SECONDS=10.0, SYNC_REPLICA_CHECK_SECONDS=5.0)
+    def test_sticky_period_shorter_than_the_replay_window(self):
+        self.assertEqual([error.id for error in routers.check_sticky_window(None)], ['api.E002'])
+
+    @override_settings(SYNC_REPLICA_DATABASES=['replica_1'], SYNC_REPLICA_STICKY_SECONDS=15.0,
+                       SYNC_REPLICA_MAX_LAG_SECONDS=10.0, SYNC_REPLICA_CHECK_SECONDS=5.0)
+    def test_sticky_period_covering_the_replay_window(self):
+        self.assertEqual(routers.check_sticky_window(None), [])
+
+
+@override_settings(SYNC_REPLICA_DATABASES=['replica_1'], SYNC_REPLICA_STICKY_SECONDS=15.0)
+class ReplicaRouterTests(TestCase):
+    """
+    replica_1 mirrors default in the test settings, so what the router picks
+    is seen in the alias, not in the data
+    """
+
+    databases = {'default', 'replica_1'}
+
+    def setUp(self):
+        cache.clear()
+        self.pool = routers.ReplicaPool()
+        patcher = mock.patch.object(routers, 'replica_pool', self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # The test cache is per process, which the pool would refuse
+        patcher = mock.patch.object(routers.ReplicaPool, 'shared_cache', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read_aliases(self, *Models):
+        return routers.read_only_endpoint(lambda: [router.db_for_read(Model) for Model in Models])()
+
+    def test_reads_outside_read_only_endpoints_use_the_primary(self):
+        self.assertEqual(router.db_for_read(AccProduct), 'default')
+
+    def test_read_only_endpoint_reads_from_the_replica(self):
+        self.assertEqual(self.read_aliases(AccProduct, SyncChange), ['replica_1', 'replica_1'])
+        self.assertEqual(router.db_for_write(AccProduct), 'default')
+
+    def test_synced_table_sticks_to_the_primary(self):
+        changes_committed.send(sender=SyncChange, table_name='acc_product')
+        self.assertEqual(self.read_aliases(AccProduct, SyncChange, AccUsers), ['default', 'default', 'replica_1'])
+
+        cache.clear()  # the markers expired
+        self.assertEqual(self.read_aliases(AccProduct), ['replica_1'])
+
+    def test_unlogged_table_reads_from_the_primary(self):
+        cache.set(UNLOGGED_TABLE_KEY.format('acc_product'), True)
+        self.assertEqual(self.read_aliases(AccProduct, AccUsers), ['default', 'replica_1'])
+
+        cache.clear()
+        self.pool._unlogged = {'acc_product'}
+        self.assertEqual(self.read_aliases(AccProduct, AccUsers), ['default', 'replica_1'])
+
+    def test_lagging_replica_is_skipped(self):
+        with mock.patch.object(routers.ReplicaPool, '_check', return_value={'healthy': False, 'error': 'lag'}):
+            self.assertEqual(self.read_aliases(AccProduct), ['default'])
+        self.assertEqual(self.pool.status()['healthy'], [])
+
+    def test_checksum_reads_generation_and_digest_from_one_database(self):
+        with CaptureQueriesContext(connections['replica_1']) as replica, \
+                CaptureQueriesContext(connection) as primary:
+            response = self.client.get('/api/tables/acc_product/checksum')
+        self.assertEqual(response.status_code, 200)
+        replica_sql = ' '.join(query['sql'] for query in replica.captured_queries)
+        self.assertIn('sync_changes', replica_sql)
+        self.assertIn('acc_product', replica_sql)
+        self.assertEqual(primary.captured_queries, [])
+
+    def test_checksum_digest_is_given_the_routed_alias(self):
+        with mock.patch.object(checksums, '_digest_python', return_value=(0, 0, [])) as digest:
+            self.client.get('/api/tables/acc_product/checksum')
+            changes_committed.send(sender=SyncChange, table_name='acc_product')
+            self.client.get('/api/tables/acc_product/checksum?buckets=2')
+        self.assertEqual([call.args[2] for call in digest.call_args_list], ['replica_1', 'default'])
+
+
+class UnloggedSyncTests(TestCase):
+    """
+    Durability levels only apply on PostgreSQL, so the resolved level and
+    the persistence switch are patched
+    """
+
+    def sync(self, **payload):
+        payload = dict({'table': 'acc_product', 'data': [{'code': 'U1'}], 'durability': UNLOGGED}, **payload)
+        with mock.patch('api.views.resolve_durability', return_value=UNLOGGED), \
+                mock.patch('api.views.relax_commit'), \
+                mock.patch('api.views.prepare_truncated_table') as prepare:
+            response = self.client.post('/api/sync', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return prepare.call_args.args[1]
+
+    def test_single_batch_is_not_made_unlogged(self):
+        self.assertEqual(self.sync(is_first_batch=True, is_last_batch=True), RELAXED)
+        self.assertEqual(self.sync(data=[], is_first_batch=True, is_last_batch=True), RELAXED)
+
+    def test_first_of_several_batches_is_made_unlogged(self):
+        self.assertEqual(self.sync(is_first_batch=True, is_last_batch=False), UNLOGGED)
+
+
+class PercentileTests(SimpleTestCase):
+
+    def test_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile(values, 0.5), 50)
+        self.assertEqual(percentile(values, 0.07), 7)
+        self.assertEqual(percentile(values, 1.0), 100)
+        self.assertEqual(percentile(list(range(1, 21)), 0.95), 19)
+        self.assertEqual(percentile([5, 6, 7, 8], 0.5), 6)
+        self.assertEqual(percentile([5], 0.99), 5)
+        self.assertEqual(percentile([3, 4], 0), 3)
+        self.assertIsNone(percentile([], 0.5))
+
+
+class ProductIndexTests(TestCase):
+
+    def setUp(self):
+        load('acc_product', [{'code': code, 'name': f'Product {code}'} for code in ('A', 'B', 'C')])
+
+    def test_least_recently_used_entries_are_evicted(self):
+        index = ProductIndex(max_entries=2, check_seconds=60)
+        index.get('A')
+        index.get('B')
+        index.get('A')
+        index.get('C')
+        self.assertEqual(list(index._entries), ['A', 'C'])
+        with self.assertNumQueries(1):
+            self.assertEqual(index.get('B')[0], 'B')
+
+    def test_missing_codes_are_cached(self):
+        index = ProductIndex(check_seconds=60)
+        self.assertEqual(index.get_many(['A', 'nope']).keys(), {'A'})
+        with self.assertNumQueries(0):
+            self.assertIsNone(index.get('nope'))
+            self.assertEqual(index.get('A')[0], 'A')
+        self.assertEqual((index.hits, index.misses), (2, 2))
+
+    def test_product_sync_invalidates_the_index(self):
+        product_index.invalidate()
+        self.addCleanup(product_index.invalidate)
+        self.assertEqual(product_index.get('A')[1], 'Product A')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/sync', {
+                'table': 'acc_product', 'data': [{'code': 'A', 'name': 'Renamed'}],
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(product_index.stats()['entries'], 0)
+        self.assertEqual(product_index.get('A')[1], 'Renamed')
+
+    def test_generation_change_drops_the_entries(self):
+        index = ProductIndex(check_seconds=0)
+        self.assertEqual(index.get('A')[1], 'Product A')
+        AccProduct.objects.filter(code='A').update(name='Changed elsewhere')
+        SyncChange.objects.create(table_name='acc_product', op=SyncChange.OP_INSERT, row_key='A')
+        self.assertEqual(index.get('A')[1], 'Changed elsewhere')
+
+    def test_rows_read_across_an_invalidation_are_not_cached(self):
+        index = ProductIndex(check_seconds=60)
+        load_rows = index._load
+
+        def racing_load(codes):
+            rows = load_rows(codes)
+            index.invalidate()
+            return rows
+
+        with mock.patch.object(index, '_load', side_effect=racing_load):
+            self.assertEqual(index.get('A')[0], 'A')
+        self.assertEqual(index.stats()['entries'], 0)
+
+
+class SnapshotTests(TransactionTestCase):
+    """
+    Tables are restored on worker threads that commit on their own
+    connections, so these run outside a test transaction
+    """
+
+    tables = ['acc_product', 'acc_users']
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'omega.snapshot')
+        load('acc_product', ChecksumParityTests.products)
+        load('acc_users', ChecksumParityTests.users)
+        self.manifest = export_snapshot(self.path, TABLE_MAPPING, self.tables)
+
+    def tearDown(self):
+        for table_name in self.tables:
+            TABLE_MAPPING[table_name]['model'].objects.all().delete()
+
+    def contents(self):
+        return (list(AccProduct.objects.order_by('code').values_list()),
+                list(AccUsers.objects.order_by('id').values_list()))
+
+    def rewrite_manifest(self, change):
+        with tarfile.open(self.path) as tar:
+            members = [(member, tar.extractfile(member).read()) for member in tar.getmembers()]
+        with tarfile.open(self.path, 'w') as tar:
+            for member, data in members:
+                if member.name == MANIFEST_NAME:
+                    manifest = json.loads(data)
+                    change(manifest)
+                    data = json.dumps(manifest).encode()
+                    member.size = len(data)
+                tar.addfile(member, io.BytesIO(data))
+
+    def test_round_trip_is_verified(self):
+        exported = self.contents()
+        self.assertEqual(self.manifest['encoding'], 'ndjson')
+        self.assertEqual(self.manifest['tables']['acc_product']['rows'], 40)
+        AccProduct.objects.filter(code__lt='P010').delete()
+        AccUsers.objects.update(role='changed')
+
+        manifest, results, errors = restore_snapshot(self.path, TABLE_MAPPING, verify=True)
+
+        self.assertEqual(errors, {})
+        self.assertEqual(sorted(result['table'] for result in results), self.tables)
+        self.assertEqual(self.contents(), exported)
+        self.assertEqual(SyncChange.objects.filter(table_name='acc_product').get().op, SyncChange.OP_SNAPSHOT)
+
+    def test_damaged_table_is_rolled_back(self):
+        self.rewrite_manifest(lambda manifest: manifest['tables']['acc_product'].update(sha256='0' * 64))
+        AccProduct.objects.filter(code='P000').update(name='kept')
+
+        _, results, errors = restore_snapshot(self.path, TABLE_MAPPING)
+
+        self.assertIn('does not match its SHA-256', errors['acc_product'])
+        self.assertEqual([result['table'] for result in results], ['acc_users'])
+        self.assertEqual(AccProduct.objects.get(code='P000').name, 'kept')
+        self.assertEqual(AccProduct.objects.count(), 40)
+
+    def test_column_mismatch_is_rejected_before_loading(self):
+        self.rewrite_manifest(lambda manifest: manifest['tables']['acc_users']['columns'].append('email'))
+        AccUsers.objects.update(role='kept')
+
+        with self.assertRaisesMessage(SnapshotError, 'acc_users: snapshot columns do not match'):
+            restore_snapshot(self.path, TABLE_MAPPING)
+        self.assertEqual(set(AccUsers.objects.values_list('role', flat=True)), {'kept'})
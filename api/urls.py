@@ -6,4 +6,10 @@ urlpatterns = [
     path('sync', views.sync_data, name='sync_data'),
     path('status', views.sync_status, name='sync_status'),
     path('health', views.health_check, name='health_check'),
+    path('changes', views.get_changes, name='get_changes'),
+    path('tables/<str:table_name>', views.get_table_info, name='table_info'),
+    path('tables/<str:table_name>/checksum', views.table_checksum_view, name='table_checksum'),
+    path('products/lookup', views.product_lookup, name='product_lookup'),
+    path('products/search', views.product_search, name='product_search'),
+    path('products/<str:code>', views.product_detail, name='product_detail'),
 ]
@@ -0,0 +1,155 @@
+"""
+Process-pool validation for large sync payloads.
+
+fast_validate_and_process_data is CPU bound (Decimal and date coercion) and
+runs under the GIL, so big payloads are split into chunks and validated in a
+persistent pool of worker processes instead.
+
+The parent only pickles the request's dicts (their keys are shared strings,
+which pickle writes once) and unpickles the result. Workers return the
+positional rows the insert path takes, with Decimal and date values as
+text (encode_rows), which unpickles several times faster and which both
+bulk_create and COPY convert again, so the parent builds nothing per record.
+Error record_index values are shifted back to positions in the original
+payload.
+
+Every server process has its own pool, so the default size is the CPU
+count divided by WEB_CONCURRENCY (gunicorn's worker count), at most
+DEFAULT_MAX_WORKERS. With a single worker the pool is skipped.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 4
+TEXT_TYPES = (Decimal, date, datetime)
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def encode_rows(rows):
+    """
+    Rows with their Decimal, date and datetime values as text
+    """
+    return [
+        tuple(str(value) if isinstance(value, TEXT_TYPES) else value for value in row)
+        for row in rows
+    ]
+
+
+def _initialize_worker(settings_module):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def _validate_chunk(table_name, offset, records):
+    from .views import fast_validate_and_process_data
+
+    rows, errors = fast_validate_and_process_data(records, table_name)
+    for error in errors:
+        error['record_index'] += offset
+    return encode_rows(rows), errors
+
+
+def create_pool(workers):
+    """
+    Start a pool of spawned worker processes with Django set up. Spawn (not
+    fork) keeps workers independent of the server's threads and DB sockets.
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_initialize_worker,
+        initargs=(settings.SETTINGS_MODULE,),
+    )
+
+
+def pool_workers():
+    """
+    SYNC_VALIDATION_POOL_WORKERS, or this server process's share of the CPUs
+    """
+    configured = getattr(settings, 'SYNC_VALIDATION_POOL_WORKERS', None)
+    if configured:
+        return configured
+    server_processes = max(1, int(os.environ.get('WEB_CONCURRENCY') or 1))
+    return max(1, min(DEFAULT_MAX_WORKERS, (os.cpu_count() or 1) // server_processes))
+
+
+def get_pool():
+    """
+    The persistent per-process pool used by sync_data
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None:
+            _pool_workers = pool_workers()
+            _pool = create_pool(_pool_workers)
+            logger.info(f"Started validation pool with {_pool_workers} processes")
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def submit_validation(executor, records, table_name, offset=0):
+    """
+    Queue one chunk; pass the future to collect_validation
+    """
+    return executor.submit(_validate_chunk, table_name, offset, records)
+
+
+def collect_validation(future):
+    """
+    Returns (rows, errors) for a submitted chunk
+    """
+    return future.result()
+
+
+def validate_records(data, table_name):
+    """
+    Drop-in replacement for fast_validate_and_process_data that uses the
+    process pool for payloads of at least SYNC_VALIDATION_POOL_MIN_ROWS
+    """
+    from .views import fast_validate_and_process_data
+
+    min_rows = getattr(settings, 'SYNC_VALIDATION_POOL_MIN_ROWS', 50000)
+    if not min_rows or len(data) < min_rows or pool_workers() < 2:
+        return fast_validate_and_process_data(data, table_name)
+
+    executor = get_pool()
+    chunk_size = max(5000, -(-len(data) // (_pool_workers * 2)))
+
+    try:
+        futures = [
+            submit_validation(executor, data[i:i + chunk_size], table_name, offset=i)
+            for i in range(0, len(data), chunk_size)
+        ]
+        processed_data = []
+        errors = []
+        for future in futures:
+            processed, chunk_errors = collect_validation(future)
+            processed_data.extend(processed)
+            errors.extend(chunk_errors)
+    except BrokenProcessPool as e:
+        logger.warning(f"Validation pool failed ({str(e)}), validating in process")
+        _reset_pool()
+        return fast_validate_and_process_data(data, table_name)
+
+    return processed_data, errors
@@ -1,10 +1,16 @@
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework import status
-from django.db import transaction, connection
+from django.db import transaction, connection, connections
 from django.http import JsonResponse
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from concurrent.futures import ThreadPoolExecutor
+import io
+import json
 import logging
+import threading
 from decimal import Decimal, InvalidOperation
 from datetime import datetime
 from .models import (
@@ -16,10 +22,25 @@ from .serializers import (
     AccPurchaseMasterSerializer, AccPurchaseDetailsSerializer,
     AccProductionSerializer, AccProductionDetailsSerializer, AccUsersSerializer
 )
+from .changelog import record_snapshot, record_inserts, record_deletes, iter_changes
+from .checksums import key_range_queryset, in_key_range, table_checksum
+from .product_cache import product_index, as_dict
+from .product_search import search_products
+from .validation_pool import validate_records
+from .routers import read_only_endpoint, replica_pool
+from .date_ranges import parse_date_range, date_range_tables, records_outside_range, replace_date_range
+from .durability import (
+    FULL, RELAXED, UNLOGGED, DURABILITY_LEVELS, resolve_durability, relax_commit,
+    prepare_truncated_table, finish_unlogged_load, wal_position, wal_bytes_since
+)
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
+def strip_text(value):
+    return str(value).strip() if value is not None else None
+
+
 # Map table names to models and serializers
 TABLE_MAPPING = {
         'acc_users': {
@@ -27,15 +48,16 @@ TABLE_MAPPING = {
         'serializer': AccUsersSerializer,
         'required_fields': ['id', 'pass_field'],
         'field_processors': {
-            'id': lambda x: str(x).strip() if x is not None else None,
-            'pass_field': lambda x: str(x).strip() if x is not None else None,
-            'role': lambda x: str(x).strip() if x is not None else None
+            'id': strip_text,
+            'pass_field': strip_text,
+            'role': strip_text
         }
     },
     'acc_invmast': {
         'model': AccInvMast,
         'serializer': AccInvMastSerializer,
         'required_fields': ['slno'],
+        'date_field': 'invdate',
         'field_processors': {
             'slno': lambda x: int(float(x)) if x is not None else None,
             'invdate': lambda x: datetime.strptime(x, '%Y-%m-%d').date() if isinstance(x, str) and x else x
@@ -45,6 +67,7 @@ TABLE_MAPPING = {
         'model': AccInvDetails,
         'serializer': AccInvDetailsSerializer,
         'required_fields': ['invno', 'code'],
+        'master': ('acc_invmast', 'invno'),
         'field_processors': {
             'invno': lambda x: int(float(x)) if x is not None else None,
             'quantity': lambda x: Decimal(str(x)) if x is not None else None
@@ -66,6 +89,7 @@ TABLE_MAPPING = {
         'model': AccPurchaseMaster,
         'serializer': AccPurchaseMasterSerializer,
         'required_fields': ['slno'],
+        'date_field': 'date',
         'field_processors': {
             'slno': lambda x: int(float(x)) if x is not None else None,
             'date': lambda x: datetime.strptime(x, '%Y-%m-%d').date() if isinstance(x, str) and x else x,
@@ -76,6 +100,7 @@ TABLE_MAPPING = {
         'model': AccPurchaseDetails,
         'serializer': AccPurchaseDetailsSerializer,
         'required_fields': ['billno', 'code'],
+        'master': ('acc_purchasemaster', 'billno'),
         'field_processors': {
             'billno': lambda x: int(float(x)) if x is not None else None,
             'quantity': lambda x: Decimal(str(x)) if x is not None else None
@@ -85,6 +110,7 @@ TABLE_MAPPING = {
         'model': AccProduction,
         'serializer': AccProductionSerializer,
         'required_fields': ['productionno'],
+        'date_field': 'date',
         'field_processors': {
             'date': lambda x: datetime.strptime(x, '%Y-%m-%d').date() if isinstance(x, str) and x else x
         }
@@ -93,6 +119,7 @@ TABLE_MAPPING = {
         'model': AccProductionDetails,
         'serializer': AccProductionDetailsSerializer,
         'required_fields': ['masterno', 'code'],
+        'master': ('acc_production', 'masterno'),
         'field_processors': {
             'qty': lambda x: Decimal(str(x)) if x is not None else None
         }
@@ -102,7 +129,10 @@ TABLE_MAPPING = {
 
 def fast_validate_and_process_data(data, table_name):
     """
-    Fast validation and data processing without using serializers for bulk operations
+    Fast validation and data processing without using serializers for bulk operations.
+    Returns (rows, errors); rows are tuples of field values in the model's
+    concrete field order, which the insert functions take without building
+    a dict per record. Fields missing from a record are None.
     """
     if table_name not in TABLE_MAPPING:
         raise ValueError(f"Unsupported table: {table_name}")
@@ -110,6 +140,9 @@ def fast_validate_and_process_data(data, table_name):
     table_config = TABLE_MAPPING[table_name]
     required_fields = table_config.get('required_fields', [])
     field_processors = table_config.get('field_processors', {})
+    fields = [(field.attname, field_processors.get(field.attname))
+              for field in table_config['model']._meta.concrete_fields]
+    known_fields = {name for name, _ in fields}
 
     processed_data = []
     errors = []
@@ -117,21 +150,34 @@ def fast_validate_and_process_data(data, table_name):
     for i, record in enumerate(data):
         try:
             # Check required fields
+            missing_field = None
             for field in required_fields:
                 if field not in record or record[field] is None or record[field] == '':
-                    errors.append({
-                        'record_index': i,
-                        'error': f'Required field "{field}" is missing or empty',
-                        'record': record
-                    })
-                    continue
+                    missing_field = field
+                    break
+            if missing_field:
+                errors.append({
+                    'record_index': i,
+                    'error': f'Required field "{missing_field}" is missing or empty',
+                    'record': record
+                })
+                continue
+
+            if not known_fields.issuperset(record):
+                errors.append({
+                    'record_index': i,
+                    'error': f'Unknown field "{sorted(record.keys() - known_fields)[0]}"',
+                    'record': record
+                })
+                continue
 
             # Process fields
-            processed_record = {}
-            for key, value in record.items():
-                if key in field_processors:
+            processed_record = []
+            for key, processor in fields:
+                value = record.get(key)
+                if processor is not None and key in record:
                     try:
-                        processed_record[key] = field_processors[key](value)
+                        value = processor(value)
                     except (ValueError, TypeError, InvalidOperation) as e:
                         errors.append({
                             'record_index': i,
@@ -139,11 +185,10 @@ def fast_validate_and_process_data(data, table_name):
                             'record': record
                         })
                         break
-                else:
-                    processed_record[key] = value
+                processed_record.append(value)
             else:
                 # Only add if no errors occurred in the inner loop
-                processed_data.append(processed_record)
+                processed_data.append(tuple(processed_record))
 
         except Exception as e:
             errors.append({
@@ -157,13 +202,14 @@ def fast_validate_and_process_data(data, table_name):
 
 def bulk_insert_optimized(Model, data, batch_size=5000):
     """
-    Optimized bulk insert with larger batch sizes and better performance
+    Optimized bulk insert with larger batch sizes and better performance.
+    Rows are tuples in concrete field order (see fast_validate_and_process_data).
     """
     total_inserted = 0
 
     for i in range(0, len(data), batch_size):
         batch = data[i:i + batch_size]
-        instances = [Model(**item) for item in batch]
+        instances = [Model(*row) for row in batch]
 
         # Use bulk_create with ignore_conflicts=False for better performance
         Model.objects.bulk_create(
@@ -176,6 +222,166 @@ def bulk_insert_optimized(Model, data, batch_size=5000):
     return total_inserted
 
 
+class ParallelInsertAborted(Exception):
+    """
+    Raised when a parallel insert was rolled back on every connection, e.g.
+    because a sibling worker failed or the workers did not all reach the
+    commit point in time
+    """
+
+
+def parallel_insert_workers(requested, row_count):
+    """
+    Number of connections to use for an append batch: the requested count
+    (or SYNC_PARALLEL_INSERT_WORKERS), capped by SYNC_PARALLEL_INSERT_MAX_WORKERS
+    and by SYNC_PARALLEL_INSERT_MIN_ROWS rows per worker. 1 means sequential.
+    """
+    if connection.vendor != 'postgresql':
+        return 1
+    workers = requested or getattr(settings, 'SYNC_PARALLEL_INSERT_WORKERS', 1)
+    workers = min(int(workers), getattr(settings, 'SYNC_PARALLEL_INSERT_MAX_WORKERS', 8))
+    min_rows = getattr(settings, 'SYNC_PARALLEL_INSERT_MIN_ROWS', 10000)
+    return max(1, min(workers, row_count // max(min_rows, 1)))
+
+
+def bulk_insert_parallel(Model, data, workers, batch_size=5000, timeout=600, synchronous_commit=True,
+                         feed_table=None):
+    """
+    Split an append batch across worker threads, each loading its share with
+    bulk_insert_optimized on its own database connection and transaction.
+
+    Workers wait for each other before committing: if any of them fails,
+    all of them roll back and an exception is raised, so the batch is
+    applied as a whole or not at all. Lock waits are bounded by
+    SYNC_PARALLEL_INSERT_LOCK_TIMEOUT (e.g. two shares holding the same key),
+    so a conflict fails fast instead of running into the barrier timeout.
+    With feed_table, the first worker records the change feed for the whole
+    batch in its own transaction, so the feed commits with the rows and the
+    caller has nothing left to write afterwards. The commits themselves are
+    separate, so only a crash in the few milliseconds between them could
+    leave part of a batch behind.
+    Must not be used while the calling transaction holds a lock the workers
+    need (e.g. after TRUNCATE on the first batch). synchronous_commit=False
+    relaxes the workers' commits like the 'relaxed' durability tier.
+    """
+    share_size = -(-len(data) // workers)
+    shares = [data[i:i + share_size] for i in range(0, len(data), share_size)]
+    barrier = threading.Barrier(len(shares), timeout=timeout)
+    failed = threading.Event()
+    lock_timeout = getattr(settings, 'SYNC_PARALLEL_INSERT_LOCK_TIMEOUT', 10.0)
+
+    def load(index, share):
+        try:
+            with transaction.atomic():
+                error = None
+                inserted = 0
+                try:
+                    if connection.vendor == 'postgresql':
+                        with connection.cursor() as cursor:
+                            cursor.execute(f"SET LOCAL lock_timeout = '{int(lock_timeout * 1000)}ms'")
+                    if not synchronous_commit:
+                        relax_commit()
+                    inserted = bulk_insert_optimized(Model, share, batch_size=batch_size)
+                    if index == 0 and feed_table:
+                        record_inserts(feed_table, Model, data)
+                except Exception as e:
+                    failed.set()
+                    error = e
+                try:
+                    barrier.wait()
+                except threading.BrokenBarrierError:
+                    failed.set()
+                if error is not None:
+                    raise error
+                if failed.is_set():
+                    raise ParallelInsertAborted()
+            return inserted
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=len(shares), thread_name_prefix='sync-insert') as executor:
+        futures = [executor.submit(load, index, share) for index, share in enumerate(shares)]
+        results = []
+        errors = []
+        aborted = 0
+        for future in futures:
+            try:
+                results.append(future.result())
+            except ParallelInsertAborted:
+                aborted += 1
+            except Exception as e:
+                errors.append(e)
+
+    if errors:
+        raise errors[0]
+    if aborted:
+        raise ParallelInsertAborted(
+            f"Parallel insert into {Model._meta.db_table} rolled back on all {len(shares)} connections: "
+            f"the workers did not reach the commit point within {timeout}s")
+    total_inserted = sum(results)
+    logger.info(f"Inserted {total_inserted} records into {Model._meta.db_table} on {len(shares)} connections")
+    return total_inserted
+
+
+def copy_csv_field(value):
+    """
+    One field of a COPY CSV stream. Every value is quoted and NULL is the
+    unquoted empty field (PostgreSQL's CSV default), so no text value, not
+    even '' or '\\N', can be read back as NULL.
+    """
+    if value is None:
+        return ''
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def copy_supported():
+    """
+    Whether the current connection can stream rows with COPY FROM STDIN
+    """
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        return hasattr(cursor.cursor, 'copy_expert')
+
+
+def copy_insert_fast(Model, data, table_name=None, batch_size=50000):
+    """
+    Bulk insert through PostgreSQL COPY, which skips per-row INSERT parsing
+    and is several times faster than bulk_create for large loads.
+    Rows are tuples in concrete field order, like bulk_insert_optimized.
+    """
+    table_name = table_name or Model._meta.db_table
+    fields = Model._meta.concrete_fields
+    quote_name = connection.ops.quote_name
+    columns = ', '.join(quote_name(field.column) for field in fields)
+    sql = f"COPY {quote_name(table_name)} ({columns}) FROM STDIN WITH (FORMAT csv)"
+    total_inserted = 0
+
+    with connection.cursor() as cursor:
+        for i in range(0, len(data), batch_size):
+            batch = data[i:i + batch_size]
+            buffer = io.StringIO()
+            for row in batch:
+                buffer.write(','.join(map(copy_csv_field, row)))
+                buffer.write('\n')
+            buffer.seek(0)
+            cursor.cursor.copy_expert(sql, buffer)
+            total_inserted += len(batch)
+
+    logger.info(f"Copied {total_inserted} records into {table_name}")
+    return total_inserted
+
+
+def bulk_insert_fastest(Model, data):
+    """
+    Insert with COPY when the backend supports it, otherwise bulk_create.
+    Returns (inserted count, method name).
+    """
+    if copy_supported():
+        return copy_insert_fast(Model, data), 'copy'
+    return bulk_insert_optimized(Model, data, batch_size=5000), 'bulk_create'
+
+
 def truncate_table_fast(Model):
     """
     Fast table truncation using raw SQL for better performance
@@ -198,6 +404,20 @@ def truncate_table_fast(Model):
             return deleted_count
 
 
+def delete_key_range(Model, key_from=None, key_to=None):
+    """
+    Delete the rows whose primary key is in [key_from, key_to), the scope a
+    client re-sends after a checksum bucket mismatch. Returns the deleted keys.
+    """
+    pk_name = Model._meta.pk.attname
+    keys = list(key_range_queryset(Model, key_from, key_to).values_list(pk_name, flat=True))
+    if keys:
+        Model.objects.filter(
+            pk__in=key_range_queryset(Model, key_from, key_to).values(pk_name)).delete()
+    logger.info(f"Deleted {len(keys)} records from {Model._meta.db_table} in key range [{key_from}, {key_to})")
+    return keys
+
+
 # Dictionary to track which tables have been truncated in the current sync session
 truncated_tables = {}
 
@@ -220,6 +440,10 @@ def sync_data(request):
         data = request.data.get('data', [])
         is_first_batch = request.data.get('is_first_batch', True)  
         is_last_batch = request.data.get('is_last_batch', True)  
+        key_range = request.data.get('key_range')
+        parallel_workers = request.data.get('parallel_workers')
+        durability = request.data.get('durability')
+        date_range = request.data.get('date_range')
 
         # Validate required fields
         if not table_name:
@@ -241,8 +465,63 @@ def sync_data(request):
                 'error': f'Table {table_name} is not supported. Supported tables: {list(TABLE_MAPPING.keys())}'
             }, status=status.HTTP_400_BAD_REQUEST)
 
+        if parallel_workers is not None and (not isinstance(parallel_workers, int) or parallel_workers < 1):
+            return Response({
+                'success': False,
+                'error': 'parallel_workers must be a positive integer'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        if key_range is not None and (not isinstance(key_range, dict) or set(key_range) - {'from', 'to'}):
+            return Response({
+                'success': False,
+                'error': 'key_range must be an object with optional "from" and "to" keys'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        if key_range:
+            pk = TABLE_MAPPING[table_name]['model']._meta.pk
+            for name, bound in key_range.items():
+                try:
+                    if bound is not None:
+                        pk.to_python(bound)
+                except ValidationError:
+                    return Response({
+                        'success': False,
+                        'error': f'key_range.{name} is not a valid {pk.attname} value'
+                    }, status=status.HTTP_400_BAD_REQUEST)
+
+        if date_range is not None:
+            if table_name not in date_range_tables(TABLE_MAPPING):
+                return Response({
+                    'success': False,
+                    'error': f'date_range is only supported for {date_range_tables(TABLE_MAPPING)}'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            if key_range is not None:
+                return Response({
+                    'success': False,
+                    'error': 'key_range and date_range cannot be combined'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                date_from, date_to = parse_date_range(date_range)
+            except ValueError as e:
+                return Response({
+                    'success': False,
+                    'error': str(e)
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+        if durability is not None and durability not in DURABILITY_LEVELS:
+            return Response({
+                'success': False,
+                'error': f'durability must be one of {list(DURABILITY_LEVELS)}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
         # Get model
         Model = TABLE_MAPPING[table_name]['model']
+        durability = resolve_durability(table_name, durability)
+        if durability == UNLOGGED and (key_range or date_range):
+            # Switching a populated table to UNLOGGED would rewrite it
+            durability = RELAXED
+        key_from = key_range.get('from') if key_range else None
+        key_to = key_range.get('to') if key_range else None
 
         logger.info(
             f"Starting sync for table: {table_name}, records: {len(data)}, first_batch: {is_first_batch}")
@@ -252,12 +531,27 @@ def sync_data(request):
         if not data:
             if is_first_batch:
                 with transaction.atomic():
-                    deleted_count = truncate_table_fast(Model)
-                    truncated_tables[table_name] = True
+                    if durability != FULL:
+                        relax_commit()
+                    if key_range:
+                        deleted_keys = delete_key_range(Model, key_from, key_to)
+                        deleted_count = len(deleted_keys)
+                        record_deletes(table_name, deleted_keys)
+                    elif date_range:
+                        deleted_by_table = replace_date_range(
+                            TABLE_MAPPING, table_name, [], date_from, date_to, is_first_batch=True)
+                        deleted_count = len(deleted_by_table.get(table_name, []))
+                        for name, keys in deleted_by_table.items():
+                            record_deletes(name, keys)
+                    else:
+                        deleted_count = truncate_table_fast(Model)
+                        truncated_tables[table_name] = True
+                        prepare_truncated_table(Model, RELAXED if is_last_batch else durability)
+                        record_snapshot(table_name)
 
                 return Response({
                     'success': True,
-                    'message': f'Successfully cleared {table_name}',
+                    'message': f'Successfully cleared {table_name}' + (' in date_range' if date_range else ''),
                     'table': table_name,
                     'records_processed': 0,
                     'records_deleted': deleted_count,
@@ -265,6 +559,9 @@ def sync_data(request):
                     'processing_time_seconds': (datetime.now() - start_time).total_seconds()
                 }, status=status.HTTP_200_OK)
             else:
+                if is_last_batch:
+                    with transaction.atomic():
+                        finish_unlogged_load(Model)
                 return Response({
                     'success': True,
                     'message': f'No data to process for {table_name}',
@@ -276,8 +573,7 @@ def sync_data(request):
 
         # Fast validation and processing
         logger.info("Starting fast validation and processing...")
-        validated_data, validation_errors = fast_validate_and_process_data(
-            data, table_name)
+        validated_data, validation_errors = validate_records(data, table_name)
 
         # If there are validation errors, return them
         if validation_errors:
@@ -291,23 +587,73 @@ def sync_data(request):
                 'sample_data': data[:2] if data else []
             }, status=status.HTTP_400_BAD_REQUEST)
 
+        if key_range:
+            pk_index = Model._meta.concrete_fields.index(Model._meta.pk)
+            outside = [i for i, row in enumerate(validated_data)
+                       if not in_key_range(Model, row[pk_index], key_from, key_to)]
+            if outside:
+                return Response({
+                    'success': False,
+                    'error': f'{len(outside)} records are outside key_range',
+                    'record_indexes': outside[:5]
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+        if date_range:
+            outside = records_outside_range(TABLE_MAPPING, table_name, validated_data, date_from, date_to)
+            if outside:
+                return Response({
+                    'success': False,
+                    'error': (f'{len(outside)} records are outside date_range' if 'date_field' in TABLE_MAPPING[table_name]
+                              else f'{len(outside)} records do not belong to a master dated in date_range'),
+                    'record_indexes': outside[:5]
+                }, status=status.HTTP_400_BAD_REQUEST)
+
         logger.info(
             f"Validation completed. Processing {len(validated_data)} valid records...")
 
+        # Append batches can be split across several connections; the first
+        # batch stays on this one because the workers would wait on its TRUNCATE,
+        # and so do date-range batches, which delete the keys they re-send
+        insert_workers = 1 if is_first_batch or date_range else parallel_insert_workers(
+            parallel_workers, len(validated_data))
+
+        wal_start = wal_position()
+
         # Perform the operation in a transaction
         with transaction.atomic():
             deleted_count = 0
+            deleted_by_table = {}
+            if durability != FULL:
+                relax_commit()
             
             # Only truncate on the first batch
-            if is_first_batch:
+            if date_range:
+                deleted_by_table = replace_date_range(
+                    TABLE_MAPPING, table_name, validated_data, date_from, date_to, is_first_batch)
+                deleted_count = len(deleted_by_table.get(table_name, []))
+            elif is_first_batch and key_range:
+                deleted_by_table = {table_name: delete_key_range(Model, key_from, key_to)}
+                deleted_count = len(deleted_by_table[table_name])
+            elif is_first_batch:
                 deleted_count = truncate_table_fast(Model)
                 truncated_tables[table_name] = True
+                # A single batch would make the table unlogged and log it
+                # again in one transaction: two rewrites and the full WAL
+                prepare_truncated_table(Model, RELAXED if is_last_batch else durability)
                 logger.info(f"Truncated table {table_name} (first batch)")
             else:
                 logger.info(f"Appending to table {table_name} (subsequent batch)")
 
             # Insert data
-            if validated_data:
+            if validated_data and insert_workers > 1:
+                # The workers record the change feed with the rows they commit
+                inserted_count = bulk_insert_parallel(
+                    Model, validated_data, insert_workers, batch_size=5000,
+                    synchronous_commit=durability == FULL, feed_table=table_name)
+                logger.info(
+                    f"Successfully inserted {inserted_count} records into {table_name} "
+                    f"using {insert_workers} connections")
+            elif validated_data:
                 inserted_count = bulk_insert_optimized(
                     Model, validated_data, batch_size=5000)
                 logger.info(
@@ -315,6 +661,22 @@ def sync_data(request):
             else:
                 inserted_count = 0
 
+            # Whatever this batch asked for, an earlier batch may have made
+            # the table unlogged
+            if is_last_batch:
+                finish_unlogged_load(Model)
+
+            # Record the change feed last so its per-table lock is held briefly
+            for name, keys in deleted_by_table.items():
+                if keys:
+                    record_deletes(name, keys)
+            if is_first_batch and not key_range and not date_range:
+                record_snapshot(table_name)
+            if validated_data and insert_workers == 1:
+                record_inserts(table_name, Model, validated_data)
+
+        wal_bytes = wal_bytes_since(wal_start)
+
         # Calculate processing time
         end_time = datetime.now()
         processing_time = (end_time - start_time).total_seconds()
@@ -325,14 +687,21 @@ def sync_data(request):
             'message': f'Successfully synced {len(validated_data)} records to {table_name}',
             'table': table_name,
             'records_processed': len(data),
-            'records_deleted': deleted_count if is_first_batch else 0,
+            'records_deleted': deleted_count if is_first_batch or date_range else 0,
             'records_inserted': inserted_count,
             'validation_errors': len(validation_errors),
             'processing_time_seconds': round(processing_time, 2),
             'records_per_second': round(len(validated_data) / processing_time, 2) if processing_time > 0 else 0,
+            'insert_workers': insert_workers,
+            'durability': durability,
+            'wal_bytes': wal_bytes,
             'is_first_batch': is_first_batch,
             'is_last_batch': is_last_batch
         }
+        if date_range:
+            response_data['date_range'] = {'from': date_from, 'to': date_to}
+            response_data['details_deleted'] = {
+                name: len(keys) for name, keys in deleted_by_table.items() if name != table_name}
 
         logger.info(f"Sync completed for {table_name}: {response_data}")
         return Response(response_data, status=status.HTTP_200_OK)
@@ -362,6 +731,7 @@ def reset_sync_session(request):
 
 
 @api_view(['GET'])
+@read_only_endpoint
 def sync_status(request):
     """
     Get the current status of all tables (record counts)
@@ -391,6 +761,110 @@ def sync_status(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+@read_only_endpoint
+def get_changes(request):
+    """
+    Stream the changes of a table after a cursor as newline-delimited JSON.
+
+    Each line is {"seq", "op", "key"} with op one of insert, delete or
+    snapshot; a snapshot means the table was fully reloaded, or that changes
+    after the consumer's cursor were pruned by the retention policy, and in
+    both cases the consumer must resync the whole table and continue from
+    the snapshot's seq. The last line is {"next_cursor", "has_more"}.
+    """
+    table_name = request.query_params.get('table', '').lower()
+
+    if not table_name:
+        return Response({
+            'success': False,
+            'error': 'Table name is required'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    if table_name not in TABLE_MAPPING:
+        return Response({
+            'success': False,
+            'error': f'Table {table_name} is not supported. Supported tables: {list(TABLE_MAPPING.keys())}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        since = int(request.query_params.get('since', 0))
+        limit = int(request.query_params.get('limit', 10000))
+        if since < 0 or not 0 < limit <= 100000:
+            raise ValueError
+    except ValueError:
+        return Response({
+            'success': False,
+            'error': 'since must be a non-negative integer and limit between 1 and 100000'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    def stream():
+        next_cursor = since
+        has_more = False
+        try:
+            for count, (seq, op, key) in enumerate(iter_changes(table_name, since, limit)):
+                if count == limit:
+                    has_more = True
+                    break
+                next_cursor = seq
+                yield json.dumps({'seq': seq, 'op': op, 'key': key}) + '\n'
+        except Exception as e:
+            logger.error(f"Change feed failed for {table_name}: {str(e)}")
+            yield json.dumps({'error': f'Failed to read changes: {str(e)}'}) + '\n'
+            return
+        yield json.dumps({'next_cursor': next_cursor, 'has_more': has_more}) + '\n'
+
+    return StreamingHttpResponse(stream(), content_type='application/x-ndjson')
+
+
+@api_view(['GET'])
+@read_only_endpoint
+def table_checksum_view(request, table_name):
+    """
+    Order-independent digest of a table, optionally split into primary-key
+    buckets, so clients can skip unchanged syncs or re-send only the
+    mismatched key ranges (with key_range on /api/sync)
+    """
+    table_name = table_name.lower()
+
+    if table_name not in TABLE_MAPPING:
+        return Response({
+            'success': False,
+            'error': f'Table {table_name} not found. Available tables: {list(TABLE_MAPPING.keys())}'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        buckets = int(request.query_params.get('buckets', 0))
+        if not 0 <= buckets <= 10000:
+            raise ValueError
+    except ValueError:
+        return Response({
+            'success': False,
+            'error': 'buckets must be an integer between 0 and 10000'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        start_time = datetime.now()
+        stripped_fields = [name for name, processor in TABLE_MAPPING[table_name].get('field_processors', {}).items()
+                           if processor is strip_text]
+        result, cached = table_checksum(table_name, TABLE_MAPPING[table_name]['model'], buckets, stripped_fields)
+
+        return Response({
+            'success': True,
+            'table': table_name,
+            **result,
+            'cached': cached,
+            'processing_time_seconds': round((datetime.now() - start_time).total_seconds(), 3)
+        }, status=status.HTTP_200_OK)
+
+    except Exception as e:
+        logger.error(f"Checksum failed for {table_name}: {str(e)}")
+        return Response({
+            'success': False,
+            'error': f'Failed to compute checksum: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @api_view(['GET'])
 def health_check(request):
     """
@@ -398,7 +872,115 @@ def health_check(request):
     """
     return Response({
         'status': 'healthy',
-        'message': 'Omega API is running'
+        'message': 'Omega API is running',
+        'replicas': replica_pool.status()
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@read_only_endpoint
+def product_detail(request, code):
+    """
+    Look up one product by code from the in-process product index
+    """
+    try:
+        values = product_index.get(code)
+    except Exception as e:
+        logger.error(f"Product lookup failed for {code}: {str(e)}")
+        return Response({
+            'success': False,
+            'error': f'Failed to look up product: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    if values is None:
+        return Response({
+            'success': False,
+            'error': f'Product {code} not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    return Response({
+        'success': True,
+        'product': as_dict(values)
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@read_only_endpoint
+def product_search(request):
+    """
+    Ranked prefix/substring search over product code, name, brand and product
+    """
+    query = request.query_params.get('q', '')
+
+    try:
+        limit = int(request.query_params.get('limit', 20))
+        if not 0 < limit <= 200:
+            raise ValueError
+    except ValueError:
+        return Response({
+            'success': False,
+            'error': 'limit must be an integer between 1 and 200'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    if not query.strip():
+        return Response({
+            'success': False,
+            'error': 'Search query (q) is required'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        start_time = datetime.now()
+        backend, results = search_products(query, limit)
+
+        return Response({
+            'success': True,
+            'query': query,
+            'backend': backend,
+            'results': results,
+            'processing_time_ms': round((datetime.now() - start_time).total_seconds() * 1000, 2)
+        }, status=status.HTTP_200_OK)
+
+    except Exception as e:
+        logger.error(f"Product search failed for {query!r}: {str(e)}")
+        return Response({
+            'success': False,
+            'error': f'Search failed: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+@read_only_endpoint
+def product_lookup(request):
+    """
+    Look up many products by code in one call: {"codes": [...]}
+    """
+    codes = request.data.get('codes') if isinstance(request.data, dict) else None
+
+    if not isinstance(codes, list) or not all(isinstance(code, str) for code in codes):
+        return Response({
+            'success': False,
+            'error': 'codes must be a list of product codes'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    if len(codes) > 10000:
+        return Response({
+            'success': False,
+            'error': 'At most 10000 codes can be looked up per call'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        found = product_index.get_many(codes)
+    except Exception as e:
+        logger.error(f"Product batch lookup failed: {str(e)}")
+        return Response({
+            'success': False,
+            'error': f'Failed to look up products: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    return Response({
+        'success': True,
+        'products': {code: as_dict(values) for code, values in found.items()},
+        'missing': [code for code in dict.fromkeys(codes) if code not in found]
     }, status=status.HTTP_200_OK)
 
 
@@ -409,6 +991,7 @@ def home(request):
 
 
 @api_view(['GET'])
+@read_only_endpoint
 def get_table_info(request, table_name):
     """
     Get detailed information about a specific table
@@ -470,6 +1053,7 @@ def clear_table(request, table_name):
         
         with transaction.atomic():
             deleted_count = truncate_table_fast(Model)
+            record_snapshot(table_name)
         
         return Response({
             'success': True,
@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import config, Csv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -46,6 +46,7 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'api.middleware.GzipRequestMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -87,6 +88,41 @@ DATABASES = {
     }
 }
 
+# Read replicas for read-only endpoints (see api/routers.py), as
+# "host[:port][/name]" entries; credentials are the primary's
+SYNC_REPLICA_DATABASES = []
+for number, replica in enumerate(config('DB_REPLICAS', default='', cast=Csv()), start=1):
+    address, _, name = replica.partition('/')
+    host, _, port = address.partition(':')
+    alias = f'replica_{number}'
+    DATABASES[alias] = dict(
+        DATABASES['default'],
+        HOST=host,
+        PORT=port or DATABASES['default']['PORT'],
+        NAME=name or DATABASES['default']['NAME'],
+        OPTIONS={'connect_timeout': config('DB_REPLICA_CONNECT_TIMEOUT', default=2, cast=int)},
+        TEST={'MIRROR': 'default'},
+    )
+    SYNC_REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['api.routers.ReplicaRouter']
+# Reads stay on the primary this long after a sync commits (read-your-writes);
+# at least SYNC_REPLICA_MAX_LAG_SECONDS + SYNC_REPLICA_CHECK_SECONDS (api.E002)
+SYNC_REPLICA_STICKY_SECONDS = config('SYNC_REPLICA_STICKY_SECONDS', default=15.0, cast=float)
+# Replicas further behind than this, or unreachable, are skipped
+SYNC_REPLICA_MAX_LAG_SECONDS = config('SYNC_REPLICA_MAX_LAG_SECONDS', default=10.0, cast=float)
+SYNC_REPLICA_CHECK_SECONDS = config('SYNC_REPLICA_CHECK_SECONDS', default=5.0, cast=float)
+
+# The replica router keeps its markers in the cache, which every server
+# process must share when DB_REPLICAS is set (needs the redis package)
+if config('CACHE_REDIS_URL', default=''):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': config('CACHE_REDIS_URL'),
+        }
+    }
+
 # REST Framework configuration
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
@@ -146,6 +182,38 @@ SECURE_CONTENT_TYPE_NOSNIFF = True
 DATA_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024  # 50MB
 FILE_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024  # 50MB
 
+# Split append batches across several database connections (PostgreSQL only).
+# A request can ask for parallel_workers; this is the default and the cap.
+SYNC_PARALLEL_INSERT_WORKERS = config('SYNC_PARALLEL_INSERT_WORKERS', default=1, cast=int)
+SYNC_PARALLEL_INSERT_MAX_WORKERS = config('SYNC_PARALLEL_INSERT_MAX_WORKERS', default=8, cast=int)
+SYNC_PARALLEL_INSERT_MIN_ROWS = config('SYNC_PARALLEL_INSERT_MIN_ROWS', default=10000, cast=int)
+# Seconds a parallel insert worker may wait for a lock before the batch is aborted
+SYNC_PARALLEL_INSERT_LOCK_TIMEOUT = config('SYNC_PARALLEL_INSERT_LOCK_TIMEOUT', default=10.0, cast=float)
+
+# Change log retention applied by the prune_changes command (0 disables a limit)
+SYNC_CHANGE_RETENTION_DAYS = config('SYNC_CHANGE_RETENTION_DAYS', default=30, cast=int)
+SYNC_CHANGE_RETENTION_ENTRIES = config('SYNC_CHANGE_RETENTION_ENTRIES', default=1000000, cast=int)
+
+# Durability of sync loads: full, relaxed or unlogged (see api/durability.py).
+# Per table as "table:level,table:level"; a request can override with durability.
+SYNC_DEFAULT_DURABILITY = config('SYNC_DEFAULT_DURABILITY', default='full')
+SYNC_TABLE_DURABILITY = dict(
+    item.split(':', 1) for item in config('SYNC_TABLE_DURABILITY', default='', cast=Csv())
+)
+
+# Validate payloads of at least this many rows in a process pool (0 disables).
+# Pool size per server process; by default the CPUs / WEB_CONCURRENCY, at most 4
+SYNC_VALIDATION_POOL_MIN_ROWS = config('SYNC_VALIDATION_POOL_MIN_ROWS', default=50000, cast=int)
+SYNC_VALIDATION_POOL_WORKERS = config('SYNC_VALIDATION_POOL_WORKERS', default=0, cast=int) or None
+
+# Per-worker product index used by /api/products lookups
+PRODUCT_CACHE_MAX_ENTRIES = config('PRODUCT_CACHE_MAX_ENTRIES', default=100000, cast=int)
+PRODUCT_CACHE_CHECK_SECONDS = config('PRODUCT_CACHE_CHECK_SECONDS', default=1.0, cast=float)
+
+# Product search: 'auto' uses pg_trgm when installed, else the in-memory n-gram index
+PRODUCT_SEARCH_BACKEND = config('PRODUCT_SEARCH_BACKEND', default='auto')
+PRODUCT_SEARCH_CHECK_SECONDS = config('PRODUCT_SEARCH_CHECK_SECONDS', default=1.0, cast=float)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
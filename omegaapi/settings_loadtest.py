@@ -0,0 +1,84 @@
+"""
+Settings for running the load-test harness against a local database.
+
+    python manage.py loadtest --settings=omegaapi.settings_loadtest
+
+Uses SQLite (loadtest.sqlite3) unless LOADTEST_DB_ENGINE=postgresql, in
+which case LOADTEST_DB_NAME/USER/PASSWORD/HOST/PORT point at a local
+PostgreSQL database. The regular DB_* variables are not needed.
+
+LOADTEST_REPLICA_DB_NAME adds a second local database of the same engine
+as a stand-in read replica (replica_1); keep it in step with the primary
+yourself, e.g. with snapshot_export/snapshot_import. The server processes
+then share a file-based cache (loadtest-cache/) for the replica router.
+Without it replica_1 only mirrors default for the router tests.
+"""
+import os
+
+for _name in ('DB_NAME', 'DB_USER', 'DB_PASSWORD', 'DB_HOST'):
+    os.environ.setdefault(_name, 'loadtest')
+
+from .settings import *  # noqa: E402,F401,F403
+from .settings import BASE_DIR  # noqa: E402
+from decouple import config  # noqa: E402
+
+DEBUG = False
+
+if config('LOADTEST_DB_ENGINE', default='sqlite') == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('LOADTEST_DB_NAME', default='omega_loadtest'),
+            'USER': config('LOADTEST_DB_USER', default='postgres'),
+            'PASSWORD': config('LOADTEST_DB_PASSWORD', default=''),
+            'HOST': config('LOADTEST_DB_HOST', default='127.0.0.1'),
+            'PORT': config('LOADTEST_DB_PORT', default='5432'),
+            'ATOMIC_REQUESTS': False,
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('LOADTEST_DB_NAME', default=str(BASE_DIR / 'loadtest.sqlite3')),
+            'OPTIONS': {'timeout': 30},
+        }
+    }
+
+SYNC_REPLICA_DATABASES = []
+if config('LOADTEST_REPLICA_DB_NAME', default=''):
+    DATABASES['replica_1'] = dict(
+        DATABASES['default'],
+        NAME=config('LOADTEST_REPLICA_DB_NAME'),
+        TEST={'MIRROR': 'default'},
+    )
+    SYNC_REPLICA_DATABASES = ['replica_1']
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': str(BASE_DIR / 'loadtest-cache'),
+        }
+    }
+else:
+    # A replica alias for the router tests (a test mirror of default); not
+    # used unless listed in SYNC_REPLICA_DATABASES
+    DATABASES['replica_1'] = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+
+# Keep request logging out of the measurements
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'level': 'WARNING',
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}